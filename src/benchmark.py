@@ -0,0 +1,200 @@
+# Import module
+import collections
+import contextlib
+import glob
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from time import perf_counter
+
+from PIL import Image
+from termcolor import colored
+from utils.box import Box
+from utils.file import File
+from utils.graphics import Graphics
+from utils.program import Arg, Command, Program
+from utils.segment import Segment
+from utils.sheet import Sheet
+
+def timed(func, repeats=1):
+    """Returns the result of func() and the best wall time of the repeats, in seconds."""
+    best = None
+    for _ in range(repeats):
+        start = perf_counter()
+        ret = func()
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best: best = elapsed
+    return ret, best
+
+def largestImages(directory, count):
+    def area(filename):
+        with Image.open(filename) as image:
+            return image.width * image.height
+    filenames = File.getNames(directory)
+    filenames.sort(key=area, reverse=True)
+    return filenames[:count]
+
+def report(rows):
+    """Prints one line per (name, before, after) row, plus the total speedup."""
+    totalBefore = 0
+    totalAfter = 0
+    for name, before, after in rows:
+        totalBefore += before
+        totalAfter += after
+        print(f"{name.ljust(48)} {before*1000:10.2f}ms {after*1000:10.2f}ms {before/max(after, 1e-9):8.1f}x")
+    Program.printSpecial(
+        f"Total: {totalBefore*1000:.2f}ms before, {totalAfter*1000:.2f}ms after ({totalBefore/max(totalAfter, 1e-9):.1f}x)"
+    )
+
+# Crop
+def pixelLoopCrop(image):
+    """The original Graphics.crop, kept as the baseline."""
+    image = image.convert('RGBA')
+    left, right, top, bottom = image.width, 0, image.height, 0
+    empty = True
+    for i in range(image.width):
+        for j in range(image.height):
+            _r, _g, _b, a = image.getpixel((i, j))
+            if a != 0:
+                left = min(left, i)
+                right = max(right, i)
+                top = min(top, j)
+                bottom = max(bottom, j)
+                empty = False
+    if(empty): return None
+    return image.crop((left, top, right+1, bottom+1))
+
+def sameImage(a, b):
+    if a is None or b is None: return a is b
+    return a.size == b.size and a.tobytes() == b.tobytes()
+
+def cropBenchmark(args):
+    count = args["count"]
+    if count is None: count = 5
+
+    rows = []
+    for filename in largestImages("raw_content/Maps", count):
+        image = File.getImage(filename)
+        before, beforeTime = timed(lambda: pixelLoopCrop(image))
+        after, afterTime = timed(lambda: Graphics.crop(image), repeats=5)
+        if not sameImage(before, after):
+            Program.printError(f"Crop mismatch on {filename}!")
+        rows.append((f"{filename} {image.width}x{image.height}", beforeTime, afterTime))
+    report(rows)
+cropCommand = Command(
+    "crop", "Benchmark Crop",
+    "Time Graphics.crop against the old per-pixel loop on the largest tilesheets in raw_content/Maps, and check that both give the same result.",
+    [ Arg.intType("count").optional() ],
+    cropBenchmark,
+)
+
+# Save
+def shellCreateDirectory(path):
+    """The original File.createDirectory, kept as the baseline."""
+    subprocess.Popen(f'mkdir -p {path}', shell=True).wait()
+
+def largestSheets(count):
+    """The count saved sheets with the most boxes, or all of them if count is None."""
+    sheets = [
+        Sheet.fromData(File.readJson(filename))
+        for filename in glob.glob("output/**/progress.json", recursive=True)
+    ]
+    sheets.sort(key=lambda sheet: len(sheet.boxes), reverse=True)
+    return sheets[:count]
+
+@contextlib.contextmanager
+def scratchDirectory():
+    """Runs the body in an empty directory that can see raw_content/, so output/ isn't touched."""
+    cwd = os.getcwd()
+    scratch = tempfile.mkdtemp()
+    os.symlink(f"{cwd}/raw_content", f"{scratch}/raw_content")
+    os.chdir(scratch)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch)
+
+def saveOnce(sheet):
+    shutil.rmtree("output", ignore_errors=True)
+    File.createdDirectories = set()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sheet.saveFinalImages()
+
+def saveBenchmark(args):
+    count = args["count"]
+    if count is None: count = 1
+
+    rows = []
+    sheets = largestSheets(count)
+    with scratchDirectory():
+        for sheet in sheets:
+            createDirectory = File.createDirectory
+            File.createDirectory = shellCreateDirectory
+            try:
+                _, beforeTime = timed(lambda: saveOnce(sheet))
+            finally:
+                File.createDirectory = createDirectory
+            _, afterTime = timed(lambda: saveOnce(sheet))
+            rows.append((f"{sheet.filename} ({len(sheet.boxes)} boxes)", beforeTime, afterTime))
+    report(rows)
+saveCommand = Command(
+    "save", "Benchmark Saving",
+    "Time Sheet.saveFinalImages on the saved sheets with the most boxes, creating folders with the old mkdir subprocess and then with File's in-process calls. Writes into a scratch directory.",
+    [ Arg.intType("count").optional() ],
+    saveBenchmark,
+)
+
+# Grid
+def savedTileSize(sheet):
+    """The most common box size in a saved sheet, which is what grid detection should find."""
+    sizes = collections.Counter((box.width, box.height) for box in sheet.boxes.values())
+    return sizes.most_common(1)[0][0]
+
+def gridBenchmark(args):
+    count = args["count"]
+
+    sheets = largestSheets(count)
+    agreed = 0
+    found = 0
+    totalTime = 0
+    for sheet in sheets:
+        image = File.getImage(sheet.filename)
+        whole = Box(0, 0, image.width, image.height)
+        (gridX, gridY), elapsed = timed(lambda: Segment.getGrid(image, whole))
+        totalTime += elapsed
+
+        pitchX = gridX[0] if gridX is not None else image.width
+        pitchY = gridY[0] if gridY is not None else image.height
+        if gridX is not None or gridY is not None: found += 1
+        saved = savedTileSize(sheet)
+        agrees = (pitchX, pitchY) == saved
+        if agrees: agreed += 1
+
+        detected = f"{pitchX}x{pitchY}" if gridX is not None or gridY is not None else "-"
+        line = f"{sheet.filename.ljust(64)} {elapsed*1000:8.2f}ms {detected.rjust(9)} {f'{saved[0]}x{saved[1]}'.rjust(9)}"
+        print(colored(line, "green") if agrees else line)
+    Program.printSpecial(
+        f"Agreed on {agreed}/{len(sheets)} sheets, found a grid in {found}, {totalTime*1000:.2f}ms total"
+    )
+gridCommand = Command(
+    "grid", "Benchmark Grid Detection",
+    "Time Segment.getGrid on every saved sheet (or the count with the most boxes) and compare the tile size it finds with the most common box size in the sheet's progress.json. Sheets where they agree are green.",
+    [ Arg.intType("count").optional() ],
+    gridBenchmark,
+)
+
+def init():
+    print("Initialized.")
+
+Program(
+    "Benchmarks",
+    init,
+    [
+        cropCommand,
+        saveCommand,
+        gridCommand,
+    ],
+).run()
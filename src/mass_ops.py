@@ -1,12 +1,17 @@
 # Import module
+from functools import partial
 from string import ascii_lowercase
 
 from termcolor import colored
+from utils.batch import Batch
+from utils.exporter import Exporter
 from utils.file import File
 from utils.graphics import Graphics
 from utils.global_tags import GlobalTags
 from utils.local_tags import LocalTags
 from utils.program import Arg, Command, Program
+from utils.sheet import Sheet
+from utils.sprite_hashes import SpriteHashes
 
 File.setImageHeight(40)
 
@@ -51,23 +56,80 @@ rmtagCommand = Command(
 )
 
 def crop(args):
-    # TODO iterate over all output files, crop each image.
+    workers = args["workers"]
+    chunkSize = args["chunkSize"]
     outputFiles = File.getNames("output")
-    for file in outputFiles:
-        image = File.getImage(file)
-        cropped = Graphics.crop(image)
-        if cropped is not None: 
-            File.saveImage(file, cropped)
-        else:
-            File.deleteFile(file, confirm=False)
-    Program.printSpecial("Done cropping everything :3")
+    results = Batch.run(
+        File.cropImageFile,
+        outputFiles,
+        workers=workers,
+        chunkSize=chunkSize,
+        label="Cropped",
+    )
+    Program.printSpecial(f"Done cropping everything :3 ({Batch.summarize(results)})")
 cropCommand = Command(
     "crop", "Crop All Images",
-    "Iterate over each image in the output directory, either resave a cropped copy of it, or delete it if it's only transparent.",
-    [],
+    "Iterate over each image in the output directory, either resave a cropped copy of it, or delete it if it's only transparent. Files that are already cropped aren't rewritten. Work is split into chunks of chunkSize files (default 64) across workers processes (default: one per core).",
+    [ Arg.intType("workers").optional(), Arg.intType("chunkSize").optional() ],
     crop,
 )
 
+def finalize(args):
+    mode = args["mode"]
+    workers = args["workers"]
+    if mode is None: mode = "stale"
+    progressFilenames = [
+        filename for filename in File.getNames("output", extension="json")
+        if filename.split("/")[-1] == "progress.json"
+    ]
+    results = Batch.run(
+        partial(Sheet.finalize, force=(mode == "all")),
+        progressFilenames,
+        workers=workers,
+        chunkSize=1,
+        label="Finalized",
+    )
+    Program.printSpecial(f"Done finalizing :3 ({Batch.summarize(results)})")
+finalizeCommand = Command(
+    "finalize", "Finalize All Sheets",
+    "Resave the sprites of every sheet marked done in the unpacker from its progress.json, without displaying anything, across workers processes (default: one per core). By default (stale) sheets whose sprites are newer than both their png and progress.json are skipped, 'all' resaves every one, e.g. after changing how sprites are cropped. Sprites deleted with the tagger's rm (recorded in progress.json) stay deleted, and sprites whose box is now empty are deleted.",
+    [ Arg.enumType("mode", ["stale", "all"]).optional(), Arg.intType("workers").optional() ],
+    finalize,
+)
+
+def dupes(args):
+    radius = args["radius"]
+    workers = args["workers"]
+    if radius is None: radius = 0
+
+    hashes = SpriteHashes.load()
+    hashes.update(File.getNames("output"), workers=workers)
+    hashes.save()
+
+    identical = hashes.getIdentical()
+    for filenames in identical:
+        print(" = ".join(filenames))
+    wasted = sum(
+        hashes.sprites[filename]["size"]
+        for filenames in identical
+        for filename in filenames[1:]
+    )
+    Program.printSpecial(
+        f"{len(identical)} groups of identical sprites, {sum(len(filenames) - 1 for filenames in identical)} extra copies ({wasted/1024:.1f}KB)"
+    )
+
+    if radius == 0: return
+    similar = hashes.getSimilar(radius)
+    for filenames in similar:
+        print(colored(" ~ ".join(filenames), "blue"))
+    Program.printSpecial(f"{len(similar)} groups of similar sprites (within {radius} bits)")
+dupesCommand = Command(
+    "dupes", "Find Duplicate Sprites",
+    "List groups of sprites in output/ whose cropped pixels are identical, and with a radius (default 0) also groups whose perceptual hashes differ in at most that many of their 64 bits, like recolors. Hashes are cached in cache/sprite_hashes.json, only new or changed files are hashed, across workers processes (default: one per core).",
+    [ Arg.intType("radius").optional(), Arg.intType("workers").optional() ],
+    dupes,
+)
+
 # # Clean Manifest
 def clean(args):
     Program.printSpecial("Removing empty tag...")
@@ -129,17 +191,21 @@ listCommand = Command(
     list,
 )
 
+def getRawFilesBySubdirectory():
+    """Every png under raw_content/, grouped by category folder (e.g. raw_content/Animals), from one walk."""
+    ret = {}
+    for filename in File.getNames("raw_content"):
+        subdirectory = "/".join(filename.split("/")[:2])
+        ret.setdefault(subdirectory, []).append(filename)
+    return ret
+
 def progressFunction(args):
     area = args["area"]
 
     if area == "tagging":
         globalTags = GlobalTags.load()
 
-        filenames = File.getNames("raw_content")
-        subdirectories = {
-            "/".join(name.split("/")[:2])
-            for name in filenames
-        }
+        subdirectories = getRawFilesBySubdirectory()
 
         def getProgress(name):
             if File.isUnpacked(name): return 2
@@ -147,7 +213,7 @@ def progressFunction(args):
             else: return 0
             
         for subdirectory in subdirectories:
-            subfilenames = File.getNames(subdirectory)
+            subfilenames = subdirectories[subdirectory]
             output = ""
             Program.printSpecial(subdirectory)
             for i in range(len(subfilenames)):
@@ -176,11 +242,7 @@ def progressFunction(args):
             print()
 
     if area == "unpacking":
-        filenames = File.getNames("raw_content")
-        subdirectories = {
-            "/".join(name.split("/")[:2])
-            for name in filenames
-        }
+        subdirectories = getRawFilesBySubdirectory()
         
         def getProgress(name):
             if File.isUnpacked(name): return 2
@@ -188,7 +250,7 @@ def progressFunction(args):
             else: return 0
             
         for subdirectory in subdirectories:
-            subfilenames = File.getNames(subdirectory)
+            subfilenames = subdirectories[subdirectory]
             output = ""
             Program.printSpecial(subdirectory)
             for i in range(len(subfilenames)):
@@ -213,33 +275,30 @@ progressCommand = Command(
 )
 
 def exportFunction(args):
-    Program.printSpecial("Exporting...")
-    
-    # delete existing exported/ directory
-    File.deleteDirectory("exported")
+    mode = args["mode"]
+    if mode is None: mode = "full"
+    Program.printSpecial(f"Exporting ({mode})...")
 
-    # make sure the folders involved are created...
-    File.ensureFolderExists("exported/sprites/")
-    File.ensureFolderExists("exported/tags/")
-    
-    # create exported/sprites/ directory and copy the entire output/ folder into it
-    files = File.getNames("output")
-    File.copyDirectory("output/", "exported/sprites/")
-    directories = File.getDirectories("exported/sprites")
-    for directory in directories:
-        File.deleteFile(f"{directory}/tags.json", confirm=False)
-        File.deleteFile(f"{directory}/progress.json", confirm=False)
+    # full exports start from an empty exported/ directory,
+    # incremental ones only touch files whose contents changed since the last export.
+    if mode == "full": exporter = Exporter.full("exported")
+    else: exporter = Exporter.incremental("exported")
+
+    # helper function for transforming the manifest's filenames so that things work right
+    def correct(filename: str):
+        return "/".join(filename.split("/")[1:])
+
+    # exported/sprites/: a copy of every image in the output/ folder
+    files = [ correct(filename) for filename in File.getNames("output") ]
+    for file in files:
+        exporter.copyFile(f"output/{file}", f"sprites/{file}")
 
     # create files:
     globalTags: GlobalTags = GlobalTags.load()
 
     #  exported/all_tags.json: lists all tags on any image.
     allTags = globalTags.getAllTags()
-    File.writeJson("exported/all_tags.json", allTags)
-
-    # helper function for transforming the manifest's filenames so that things work right
-    def correct(filename: str):
-        return "/".join(filename.split("/")[1:])
+    exporter.writeJson("all_tags.json", allTags)
 
     #  exported/tags/<tag>.json: lists all files associated with the tag.
     for tag in allTags:
@@ -248,8 +307,8 @@ def exportFunction(args):
             correct(filename) for filename in filesWithTag
         ]
         sharedTags = globalTags.getSharedTags(tag)
-        File.writeJson(
-            f"exported/tags/{tag}.json",
+        exporter.writeJson(
+            f"tags/{tag}.json",
             {
                 "files": filesWithTag,
                 "shared": sharedTags,
@@ -257,38 +316,44 @@ def exportFunction(args):
         )
 
     #  exported/sprites/<sprite path>/<index>_tags.json: lists all tags on the corresponding image.
-    files = [ correct(filename) for filename in File.getNames("output") ]
     for file in files:
-        tagFilename = f"exported/sprites/{file}".replace(".png", "t.json")
+        tagFilename = f"sprites/{file}".replace(".png", "t.json")
         fileTags = globalTags.getFileTags(f"output/{file}")
-        File.writeJson(tagFilename, fileTags)
+        exporter.writeJson(tagFilename, fileTags)
 
-    Program.printSpecial("Donezo :3")
+    counts = exporter.finish()
+    Program.printSpecial(
+        f"Donezo :3 ({counts['written']} written, {counts['unchanged']} unchanged, {counts['deleted']} deleted)"
+    )
 exportCommand = Command(
     "export", "Export Manifest",
-    "Export the manifest in a format which is consumable for the frontend.",
-    [],
+    "Export the manifest in a format which is consumable for the frontend. A full export (the default) rebuilds exported/ from scratch, an incremental one only copies, writes or deletes the files that changed since the last export.",
+    [ Arg.enumType("mode", ["full", "incremental"]).optional() ],
     exportFunction,
 )
 
 def init():
     print("Initialized.")
 
-Program(
-    "Mass Tagger",
-    init,
-    [
-        # tag commands
-        rmtagCommand,
-        listCommand,
-        showCommand,
-        
-        # cleanup commands
-        cropCommand,
-        cleanCommand,
-        
-        # export!
-        exportCommand,
-        progressCommand,
-    ],
-).run()
\ No newline at end of file
+# Worker processes re-import this module, so only start the prompt from the main process.
+if __name__ == "__main__":
+    Program(
+        "Mass Tagger",
+        init,
+        [
+            # tag commands
+            rmtagCommand,
+            listCommand,
+            showCommand,
+            
+            # cleanup commands
+            cropCommand,
+            finalizeCommand,
+            cleanCommand,
+            dupesCommand,
+            
+            # export!
+            exportCommand,
+            progressCommand,
+        ],
+    ).run()
\ No newline at end of file
@@ -1,7 +1,8 @@
 # Import module
-from math import ceil
 import sys
 from utils.file import File
+from utils.page_index import PageIndex
+from utils.page_renderer import PageRenderer
 from utils.program import Arg, Command, Program
 from utils.program_exception import ProgramException
 from utils.local_tags import LocalTags
@@ -20,57 +21,35 @@ if len(sys.argv) != 2:
 
 rootDirectory = sys.argv[1]
 print(f"Tagging {rootDirectory}")
-dirs = File.getDirectories(rootDirectory)
 
 def setTags(newTags):
     global tags, previousTags
     previousTags = tags
     tags = newTags
-    tags.save()
+    tags.saveLater()
 
 pageSize = 32
 
-pages = []
+pages = PageIndex(rootDirectory, pageSize)
 currentPageIndex = 0
+renderer = PageRenderer()
 
 def step(count, caption=None):
     global currentPageIndex, currentPage, currentDirectory
     global tags, previousTags
-    currentPageIndex = currentPageIndex + count
+    currentPageIndex = pages.clamp(currentPageIndex + count)
     if currentPageIndex < 0:
-        currentPageIndex = 0
-    if currentPageIndex >= len(pages):
-        currentPageIndex = len(pages)-1
-    currentPage = pages[currentPageIndex]
-    currentDirectory = pageDirectories[currentPageIndex]
+        Program.printError(f"No images to tag in {rootDirectory}.")
+        exit()
+    currentDirectory, currentPage = pages.getPage(currentPageIndex)
     previousTags = tags = LocalTags.load(currentDirectory)
     messages = []
     if caption is not None: messages.append(caption)
     if count is not 0: messages.append(f"Stepped by {count}.")
     displayPage("\n".join(messages))
 
-def getFilenameKey(filename):
-    key = File.getIndex(filename)
-    try: return int(key)
-    except: return key
-
 def recalculate(caption=None):
-    global pages, allFiles, pageDirectories
-    pages = []
-    pageDirectories = []
-    for directory in dirs:
-
-        allFiles = File.getNames(directory)
-        allFiles.sort(key=getFilenameKey)
-
-        subpages = ceil(len(allFiles)/pageSize)
-        for i in range(subpages):
-            page = [
-                int(file.split("/")[-1].split('.')[0])
-                for file in allFiles[i*pageSize : (i+1)*pageSize]
-            ]
-            pages.append(page)
-            pageDirectories.append(directory)
+    pages.reset()
 
     # freshly clamp page index
     step(0, caption=caption)
@@ -79,18 +58,36 @@ def filenameByIndex(index):
     global currentDirectory
     return f"{currentDirectory}/{index}.png"
 
+def getCaptions(pageTags, indices):
+    return [ " ".join(pageTags.getTags(index)) for index in indices ]
+
+def prefetchNeighbors():
+    """Starts rendering the pages before and after the current one in the background."""
+    global currentPageIndex, currentDirectory, tags
+    neighbors = []
+    for pageIndex in [ currentPageIndex + 1, currentPageIndex - 1 ]:
+        if pageIndex < 0 or pages.clamp(pageIndex) != pageIndex: continue
+        directory, indices = pages.getPage(pageIndex)
+        pageTags = tags if directory == currentDirectory else LocalTags.load(directory)
+        neighbors.append((
+            [ f"{directory}/{index}.png" for index in indices ],
+            getCaptions(pageTags, indices),
+        ))
+    renderer.prefetch(neighbors)
+
 def display(indices, caption):
     global tags
     filenames = [ filenameByIndex(index) for index in indices ]
-    captions = [ " ".join(tags.getTags(index)) for index in indices ]
-    File.displayAllWithCaptions(filenames, captions, caption=caption)
+    File.displayImage(renderer.get(filenames, getCaptions(tags, indices)))
+    print(caption)
+    prefetchNeighbors()
 
 def displayPage(caption):
     global currentPageIndex, pages, currentPage, currentDirectory
     global tags, previousTags
     display(
         currentPage,
-        f"Current: {currentPageIndex+1}/{len(pages)}, {currentDirectory}\n{caption}",
+        f"Current: {currentPageIndex+1}/{pages.getTotal()}, {currentDirectory}\n{caption}",
     )
 
 def tagFunction(args):
@@ -179,6 +176,7 @@ def removeFile(args):
         filename = filenameByIndex(index)
         try:
             File.deleteFile(filename) # will throw error if no consent
+            File.recordDeletedSprite(filename)
             setTags(tags.withoutIndex(index))
             recalculate(caption=f"Deleted {filename}")
             previousTags = None # prevent undo, because you can't undelete the file.
@@ -196,7 +194,7 @@ def stepFunction(args):
     count = args["count"]
     if count is None: count = 1
 
-    if (count > 0 and currentPageIndex == len(pages)-1):
+    if (count > 0 and pages.isLast(currentPageIndex)):
         Program.printSpecial('"This is the end" --Adele')
         return
     if (count < 0 and currentPageIndex == 0):
@@ -1,6 +1,7 @@
 # Import module
 from termcolor import colored
 from utils.graphics import Graphics
+from utils.history import History
 from utils.input import Input
 from utils.program import Arg, Command, Program
 from utils.program_exception import ProgramException
@@ -40,8 +41,8 @@ def isNotDoneValidation():
         raise ProgramException("Invalid state for that operation.")
     
 def setSheet(newSheet):
-    global sheet, previousSheet
-    previousSheet = sheet
+    global sheet
+    history.record(sheet.boxes, newSheet.boxes)
     sheet = newSheet
 
 def display(caption=None):
@@ -68,14 +69,14 @@ def resetViewport():
         setViewport(Box(0, 0, image.width, image.height))
 
 def setFilename(index, show=True):
-    global sheet, previousSheet, filename, filenames, fileIndex
+    global sheet, history, filename, filenames, fileIndex
 
     fileIndex = index
     filename = filenames[index]
     resetViewport()
     # img = Image.open(allFiles[0])
     sheet = Sheet.initial(filename)
-    previousSheet = None
+    history = History.initial()
 
     caption = None
 
@@ -84,6 +85,7 @@ def setFilename(index, show=True):
     progressFilename = f"{outputDirectory}/progress.json"
     if File.exists(progressFilename):
         sheet = Sheet.fromData(File.readJson(progressFilename))
+        history = History.load(outputDirectory, sheet.toData())
         caption = "Loaded from progress.json."
     
     display(caption)
@@ -106,16 +108,20 @@ def step(count):
 
     setFilename(newIndex)
 
-def save(args):
+def saveProgress(done=False):
     File.writeJson(
-        f"{sheet.getDirectory()}/progress.json",
-        sheet.toData(),
+        sheet.getProgressFilename(),
+        sheet.getProgressData(done),
     )
+    history.save(sheet.getDirectory(), sheet.toData())
+
+def save(args):
+    saveProgress()
     Program.printSpecial("Backed up progress.")
 saveCommand = Command(
     "save",
     "Save Progress",
-    "Save your work so far. The saved state is used whenever you come back to this sheet, on subsequent runs of the program or via page navigation.",
+    "Save your work so far. The saved state, and its undo history, are used whenever you come back to this sheet, on subsequent runs of the program or via page navigation.",
     [],
     save,
     validation=isNotDoneValidation,
@@ -123,7 +129,8 @@ saveCommand = Command(
 
 def done(args):
     global sheet
-    save({})
+    saveProgress(done=True)
+    Program.printSpecial("Backed up progress.")
     sheet.saveFinalImages()
     display("Saved output.")
 doneCommand = Command(
@@ -139,6 +146,7 @@ def redo(args):
     outputFiles = getOutputFiles()
     for file in outputFiles:
         File.deleteFile(file, confirm=False)
+    Sheet.unmarkDone(sheet.getProgressFilename())
     display("Unfinalized!")
 redoCommand = Command(
     "redo",
@@ -218,6 +226,61 @@ divideCommand = Command(
     validation=isNotDoneValidation,
 )
 
+def gridDivide(args):
+    index = args["index"]
+    action = args["action"]
+
+    box = sheet.boxes[index]
+    gridX, gridY = sheet.detectGrid(index)
+    if gridX is None and gridY is None:
+        raise ProgramException(f"Couldn't find a repeating grid in {index}.")
+    pitchX, offsetX = gridX if gridX is not None else (box.width, 0)
+    pitchY, offsetY = gridY if gridY is not None else (box.height, 0)
+
+    if action != "slice":
+        xString = f"pitch {pitchX} offset {offsetX}" if gridX is not None else "no grid"
+        yString = f"pitch {pitchY} offset {offsetY}" if gridY is not None else "no grid"
+        print(
+            "\n".join([
+                f"Width  {str(box.width).rjust(4)} | {colored(xString, "blue")}",
+                f"Height {str(box.height).rjust(4)} | {colored(yString, "blue")}",
+                f"Run 'grid {index} slice' to slice along it.",
+            ])
+        )
+        return
+
+    setSheet(
+        sheet.getGridSliced(index, pitchX, pitchY, offsetX, offsetY)
+    )
+    display(f"Sliced {index} along a {pitchX}x{pitchY} grid offset by ({offsetX}, {offsetY})")
+gridDivideCommand = Command(
+    "grid",
+    "Grid Divide",
+    "Guess the tile size and offset of the grid inside a box from where its colors change sharply, and list them. With slice, slice the box along that grid.",
+    [ Arg.intType("index"), Arg.enumType("action", ["slice"]).optional() ],
+    gridDivide,
+    validation=isNotDoneValidation,
+)
+
+def autoSegment(args):
+    gap = args["gap"]
+    if gap == None: gap = 0
+    if gap < 0:
+        raise ProgramException("gap must be at least 0.")
+    newSheet = Sheet.segmented(filename, gap)
+    if len(newSheet.boxes) == 0:
+        raise ProgramException("There are no non-transparent pixels to segment.")
+    setSheet(newSheet)
+    display(f"Found {len(newSheet.boxes)} sprites with gap={gap}")
+autoSegmentCommand = Command(
+    "auto",
+    "Auto Segment",
+    "Replace all boxes with one box around each group of non-transparent pixels. Groups with no more than gap transparent pixels between them (default 0) become one box.",
+    [ Arg.intType("gap").optional() ],
+    autoSegment,
+    validation=isNotDoneValidation,
+)
+
 def divisorsOf(args):
     index = args["index"]
 
@@ -290,17 +353,35 @@ shiftCommand = Command(
 )
 
 def undo(args):
-    setSheet(previousSheet)
-    display(f"Undid previous operation.")
+    global sheet
+    count = args["count"]
+    if count == None: count = 1
+    sheet = history.undo(sheet, count)
+    display(f"Undid {count} operation(s).")
 undoCommand = Command(
     "u",
     "Undo",
-    "Undo the previous action. Only one action is stored.",
-    [],
+    "Undo the previous action, or the last count actions. History is kept across saves and restarts.",
+    [ Arg.intType("count").optional() ],
     undo,
     validation=isNotDoneValidation,
 )
 
+def redoAction(args):
+    global sheet
+    count = args["count"]
+    if count == None: count = 1
+    sheet = history.redo(sheet, count)
+    display(f"Redid {count} operation(s).")
+redoActionCommand = Command(
+    "re",
+    "Redo",
+    "Redo an action undone with u, or the last count of them. Making any other edit clears what can be redone.",
+    [ Arg.intType("count").optional() ],
+    redoAction,
+    validation=isNotDoneValidation,
+)
+
 def zoom(args):
     global viewport
     indices = args["indices"]
@@ -331,11 +412,14 @@ Program(
         divideCommand,
         cutCommand,
         shiftCommand,
+        autoSegmentCommand,
+        gridDivideCommand,
 
         divisorsCommand,
         zoomCommand,
         
         undoCommand,
+        redoActionCommand,
         
         resetCommand,
         stepCommand,
@@ -0,0 +1,70 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable
+
+
+class Batch:
+    """Runs a function over many items across a pool of worker processes, in chunks."""
+
+    def defaultWorkers() -> int:
+        return os.cpu_count() or 1
+
+    def runChunk(func: Callable, chunk: list) -> list:
+        return [ func(item) for item in chunk ]
+
+    def chunked(items: list, chunkSize: int) -> list[list]:
+        return [
+            items[i : i+chunkSize]
+            for i in range(0, len(items), chunkSize)
+        ]
+
+    def run(
+        func: Callable,
+        items: list,
+        workers: int=None,
+        chunkSize: int=64,
+        label: str="Processed",
+    ) -> list:
+        """
+        Calls func on every item and returns the results, in the same order as items.
+
+        func has to be picklable (a module level function or a class function),
+        because it is sent to the worker processes. With one worker, everything
+        runs in this process instead.
+        """
+        if workers is None: workers = Batch.defaultWorkers()
+        if chunkSize is None or chunkSize < 1: chunkSize = 64
+        total = len(items)
+        chunks = Batch.chunked(items, chunkSize)
+        results = [ None ] * len(chunks)
+
+        done = 0
+        def progress(count):
+            nonlocal done
+            done += count
+            print(f"\r{label} {done}/{total}", end='', flush=True)
+
+        if workers <= 1:
+            for i in range(len(chunks)):
+                results[i] = Batch.runChunk(func, chunks[i])
+                progress(len(chunks[i]))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(Batch.runChunk, func, chunks[i]): i
+                    for i in range(len(chunks))
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    results[i] = future.result()
+                    progress(len(chunks[i]))
+        print()
+        return [ result for chunk in results for result in chunk ]
+
+    def summarize(results: list) -> str:
+        """Counts each distinct result, e.g. '3 rewritten, 10 unchanged'."""
+        counts = Counter(results)
+        return ", ".join([
+            f"{counts[result]} {result}" for result in sorted(counts)
+        ])
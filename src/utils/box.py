@@ -154,6 +154,34 @@ class Box:
                 )
         return newBoxes
     
+    def getGridCuts(length: int, pitch: int, offset: int):
+        """Where to cut a span of length for a grid of pitch starting at offset, including both ends."""
+        if pitch <= 0:
+            raise ProgramException("Grid pitch must be >0")
+        return sorted(set([0, length] + list(range(offset % pitch, length, pitch))))
+
+    def getGridSliced(self, pitchX: int, pitchY: int, offsetX: int=0, offsetY: int=0):
+        """
+        Cuts the box along a grid of pitchX x pitchY tiles whose lines sit offsetX and
+        offsetY from the top-left. Unlike getSliced the tiles needn't fit exactly,
+        any leftover along an edge becomes a narrower box.
+        """
+        xValues = Box.getGridCuts(self.width, pitchX, offsetX)
+        yValues = Box.getGridCuts(self.height, pitchY, offsetY)
+
+        newBoxes = []
+        for j in range(len(yValues) - 1):
+            for i in range(len(xValues) - 1):
+                newBoxes.append(
+                    Box(
+                        self.left + xValues[i],
+                        self.top + yValues[j],
+                        xValues[i+1] - xValues[i],
+                        yValues[j+1] - yValues[j],
+                    )
+                )
+        return newBoxes
+
     def getCut(self, side: Side, pixels):
         if side == 'l':
             return [ self.withSide('r', self.left+pixels), self.withSide('l', self.left+pixels) ]
@@ -212,6 +240,14 @@ class Box:
             fill=color,
         )
 
+    def translate(self, x, y):
+        return Box(
+            self.left + x,
+            self.top + y,
+            self.width,
+            self.height,
+        )
+
     def scale(self, factor):
         return Box(
             self.left * factor,
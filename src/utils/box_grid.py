@@ -0,0 +1,87 @@
+from utils.box import Box
+from utils.box_map import BoxMap
+
+
+class BoxGrid:
+    """
+    A uniform grid of box indices, kept alongside Sheet.boxes, for finding the boxes
+    that intersect a region or contain a point without testing every box.
+
+    Each cell holds the indices of the boxes overlapping it. Like BoxMap it's
+    immutable: an edit copies the cell table and rebuilds only the cells it touches.
+    """
+    cellSize = 64
+
+    cells: dict[tuple[int, int], frozenset[int]]
+
+    def __init__(self, cells):
+        self.cells = cells
+
+    def fromBoxes(boxes: BoxMap) -> 'BoxGrid':
+        return BoxGrid({}).withChanges(BoxMap.empty(), dict(boxes.items()))
+
+    def getCells(left, top, right, bottom) -> list[tuple[int, int]]:
+        """The cells overlapping the pixels from (left, top) up to, not including, (right, bottom)."""
+        size = BoxGrid.cellSize
+        return [
+            (x, y)
+            for x in range(left // size, (right - 1) // size + 1)
+            for y in range(top // size, (bottom - 1) // size + 1)
+        ]
+
+    def withChanges(self, boxes: BoxMap, changes: dict[int, Box | None]) -> 'BoxGrid':
+        """
+        The grid after setting or (with None) removing the box at each index,
+        where boxes is the map from before the changes.
+        """
+        touched = {}
+        def cell(key):
+            if key not in touched:
+                touched[key] = set(self.cells.get(key, ()))
+            return touched[key]
+
+        for index, box in changes.items():
+            oldBox = boxes.get(index)
+            if oldBox is not None:
+                for key in BoxGrid.getCells(*oldBox.getLTRB()):
+                    cell(key).discard(index)
+            if box is not None:
+                for key in BoxGrid.getCells(*box.getLTRB()):
+                    cell(key).add(index)
+
+        cells = dict(self.cells)
+        for key, indices in touched.items():
+            if len(indices) == 0: cells.pop(key, None)
+            else: cells[key] = frozenset(indices)
+        return BoxGrid(cells)
+
+    def getCandidates(self, left, top, right, bottom) -> set[int]:
+        """Indices of every box that might overlap the region. Some might not."""
+        ret = set()
+        if right <= left or bottom <= top: return ret
+        size = BoxGrid.cellSize
+        x0, x1 = left // size, (right - 1) // size
+        y0, y1 = top // size, (bottom - 1) // size
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            # the region covers more cells than are in use, so scan the used ones instead
+            for (x, y), indices in self.cells.items():
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    ret.update(indices)
+            return ret
+        for key in BoxGrid.getCells(left, top, right, bottom):
+            ret.update(self.cells.get(key, ()))
+        return ret
+
+    def getIntersecting(self, boxes: BoxMap, region: Box) -> list[int]:
+        """Indices of the boxes that intersect region, in index order."""
+        return sorted([
+            index for index in self.getCandidates(*region.getLTRB())
+            if boxes[index].intersects(region)
+        ])
+
+    def getContaining(self, boxes: BoxMap, x: int, y: int) -> list[int]:
+        """Indices of the boxes that contain the pixel (x, y), in index order."""
+        return sorted([
+            index for index in self.getCandidates(x, y, x + 1, y + 1)
+            if boxes[index].contains(x, y)
+        ])
@@ -0,0 +1,150 @@
+from typing import Iterator
+
+from utils.box import Box
+
+
+class BoxMap:
+    """
+    An immutable map from box index to Box, used for Sheet.boxes.
+
+    Boxes are stored in fixed-size chunks, and an edit only copies the chunks it
+    touches (plus the tuple of chunks), so versions share everything else. The
+    indices below the highest one that aren't in use are kept sorted, so the next
+    free index (the lowest one not in use) never needs a search.
+    """
+    chunkSize = 64
+
+    chunks: tuple[tuple[Box | None, ...], ...]
+    count: int
+    end: int
+    free: tuple[int, ...]
+
+    def __init__(self, chunks, count, end, free):
+        self.chunks = chunks
+        # number of boxes
+        self.count = count
+        # one past the highest index ever used
+        self.end = end
+        # sorted indices below end that hold no box
+        self.free = free
+
+    def empty() -> 'BoxMap':
+        return BoxMap((), 0, 0, ())
+
+    def fromDict(boxes: dict[int, Box]) -> 'BoxMap':
+        return BoxMap.empty().withChanges(boxes)
+
+    def toDict(self) -> dict[int, Box]:
+        return dict(self.items())
+
+    # Reading, same as a dict
+
+    def get(self, index: int, fallback=None) -> Box | None:
+        if type(index) is not int or index < 0: return fallback
+        chunkIndex, offset = divmod(index, BoxMap.chunkSize)
+        if chunkIndex >= len(self.chunks): return fallback
+        box = self.chunks[chunkIndex][offset]
+        if box is None: return fallback
+        return box
+
+    def __getitem__(self, index: int) -> Box:
+        box = self.get(index)
+        if box is None: raise KeyError(index)
+        return box
+
+    def __contains__(self, index) -> bool:
+        return self.get(index) is not None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def items(self) -> Iterator[tuple[int, Box]]:
+        """Every (index, box) pair, in index order."""
+        for chunkIndex in range(len(self.chunks)):
+            chunk = self.chunks[chunkIndex]
+            for offset in range(BoxMap.chunkSize):
+                if chunk[offset] is not None:
+                    yield chunkIndex*BoxMap.chunkSize + offset, chunk[offset]
+
+    def keys(self) -> list[int]:
+        return [ index for index, _box in self.items() ]
+
+    def values(self) -> list[Box]:
+        return [ box for _index, box in self.items() ]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.keys())
+
+    # Editing, each returns a new map
+
+    def nextIndices(self, count: int) -> list[int]:
+        """The indices that count boxes added one after another would get."""
+        ret = list(self.free[:count])
+        return ret + list(range(self.end, self.end + count - len(ret)))
+
+    def withChanges(self, changes: dict[int, Box | None]) -> 'BoxMap':
+        """Sets or (with None) removes the box at each index, in one pass."""
+        if len(changes) == 0: return self
+
+        chunks = list(self.chunks)
+        touched = {}
+        count = self.count
+        end = self.end
+        for index, box in changes.items():
+            if index < 0:
+                raise KeyError(index)
+            chunkIndex, offset = divmod(index, BoxMap.chunkSize)
+            while chunkIndex >= len(chunks):
+                chunks.append((None,) * BoxMap.chunkSize)
+            if chunkIndex not in touched:
+                touched[chunkIndex] = list(chunks[chunkIndex])
+            chunk = touched[chunkIndex]
+
+            if chunk[offset] is None and box is not None: count += 1
+            if chunk[offset] is not None and box is None: count -= 1
+            chunk[offset] = box
+            if box is not None: end = max(end, index + 1)
+
+        for chunkIndex in touched:
+            chunks[chunkIndex] = tuple(touched[chunkIndex])
+
+        # recompute the holes only around the indices that changed
+        free = set(self.free)
+        free.update(range(self.end, end))
+        for index, box in changes.items():
+            if index >= end: continue
+            if box is None: free.add(index)
+            else: free.discard(index)
+
+        return BoxMap(tuple(chunks), count, end, tuple(sorted(free)))
+
+    def withBoxes(self, boxes: list[Box]) -> 'BoxMap':
+        """Adds boxes, each at the lowest index not in use, like adding them one by one would."""
+        return self.withChanges(dict(zip(self.nextIndices(len(boxes)), boxes)))
+
+    def without(self, indices: list[int]) -> 'BoxMap':
+        changes = {}
+        for index in indices:
+            if index not in self: raise KeyError(index)
+            changes[index] = None
+        return self.withChanges(changes)
+
+    def diff(self, other: 'BoxMap') -> tuple[dict[int, Box], dict[int, Box]]:
+        """
+        Returns (removed, added): the boxes only in self and the boxes only in other,
+        by index. A box that changed shows up in both. Chunks shared by the two
+        versions are skipped without looking inside.
+        """
+        removed = {}
+        added = {}
+        emptyChunk = (None,) * BoxMap.chunkSize
+        for chunkIndex in range(max(len(self.chunks), len(other.chunks))):
+            mine = self.chunks[chunkIndex] if chunkIndex < len(self.chunks) else emptyChunk
+            theirs = other.chunks[chunkIndex] if chunkIndex < len(other.chunks) else emptyChunk
+            if mine is theirs: continue
+            for offset in range(BoxMap.chunkSize):
+                if mine[offset] is theirs[offset]: continue
+                index = chunkIndex*BoxMap.chunkSize + offset
+                if mine[offset] is not None: removed[index] = mine[offset]
+                if theirs[offset] is not None: added[index] = theirs[offset]
+        return removed, added
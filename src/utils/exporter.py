@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import shutil
+
+from utils.file import File
+
+
+class Exporter:
+    """
+    Writes files into exported/, remembering a content hash of everything it wrote
+    (and the mtime and size of copied sources). A later export with the same
+    manifest only copies, writes or deletes the files whose contents changed.
+    """
+    manifestFilename = "cache/export_manifest.json"
+
+    manifest: dict[str, dict]
+
+    def __init__(self, root: str, manifest: dict[str, dict]):
+        self.root = root
+        # exported path -> { "hash", "mtime"?, "size"? }
+        self.manifest = manifest
+        self.exported = {}
+        self.counts = { "written": 0, "unchanged": 0, "deleted": 0 }
+
+    def full(root: str) -> 'Exporter':
+        """An exporter that starts from an empty root and writes everything."""
+        if os.path.isdir(root):
+            File.deleteDirectory(root)
+        return Exporter(root, {})
+
+    def incremental(root: str) -> 'Exporter':
+        """An exporter that reuses the manifest of the last export into root."""
+        if not os.path.isdir(root):
+            return Exporter(root, {})
+        return Exporter(root, File.readJson(Exporter.manifestFilename, {}))
+
+    def hashBytes(contents: bytes) -> str:
+        return hashlib.sha1(contents).hexdigest()
+
+    def isCurrent(self, dest: str, contentHash: str) -> bool:
+        entry = self.manifest.get(dest)
+        return entry is not None and entry["hash"] == contentHash and File.exists(dest)
+
+    def copyFile(self, source: str, dest: str) -> None:
+        dest = f"{self.root}/{dest}"
+        stat = os.stat(source)
+        entry = self.manifest.get(dest)
+        if (
+            entry is not None
+            and entry.get("mtime") == stat.st_mtime_ns
+            and entry.get("size") == stat.st_size
+            and File.exists(dest)
+        ):
+            self.exported[dest] = entry
+            self.counts["unchanged"] += 1
+            return
+
+        with open(source, "rb") as file:
+            contentHash = Exporter.hashBytes(file.read())
+        if self.isCurrent(dest, contentHash):
+            self.counts["unchanged"] += 1
+        else:
+            File.writeInFolder(dest, lambda: shutil.copyfile(source, dest))
+            self.counts["written"] += 1
+        self.exported[dest] = {
+            "hash": contentHash,
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+        }
+
+    def writeJson(self, dest: str, data) -> None:
+        dest = f"{self.root}/{dest}"
+        contents = json.dumps(data)
+        contentHash = Exporter.hashBytes(contents.encode())
+        if self.isCurrent(dest, contentHash):
+            self.counts["unchanged"] += 1
+        else:
+            File.writeText(dest, contents)
+            self.counts["written"] += 1
+        self.exported[dest] = { "hash": contentHash }
+
+    def finish(self) -> dict[str, int]:
+        """Deletes whatever the last export wrote that this one didn't, and saves the manifest."""
+        for dest in self.manifest:
+            if dest not in self.exported:
+                File.deleteFile(dest, confirm=False)
+                self.counts["deleted"] += 1
+        File.writeJson(Exporter.manifestFilename, self.exported)
+        self.manifest = self.exported
+        return self.counts
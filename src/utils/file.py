@@ -1,7 +1,13 @@
 
+import base64
+from functools import lru_cache
+import io
 import json
 import os
+import shutil
+import struct
 import subprocess
+import sys
 from typing import Callable
 
 from PIL import Image
@@ -10,6 +16,7 @@ from utils.graphics import Graphics
 from utils.input import Input
 from utils.program import Program
 from utils.program_exception import ProgramException
+from utils.tile_cache import TileCache
 
 class File:
     """Handles all file IO operations."""
@@ -31,33 +38,113 @@ class File:
     def exists(filename):
         return os.path.isfile(filename)
 
+    # Directories this process already made, so repeated saves into one folder skip the syscall.
+    createdDirectories: set[str] = set()
+
     def createDirectory(path):
-        # print(f"Creating folder {path}...", end='')
-        subprocess.Popen(f'mkdir -p {path}', shell=True).wait()
-        # print("done.")
+        if path == "" or path in File.createdDirectories: return
+        os.makedirs(path, exist_ok=True)
+        File.createdDirectories.add(path)
+
+    def forgetDirectories(path):
+        """Drops path and everything under it from the created directory memo."""
+        File.createdDirectories = {
+            directory for directory in File.createdDirectories
+            if directory != path and not directory.startswith(f"{path}/")
+        }
 
     def ensureFolderExists(filename):
         path = '/'.join(filename.split('/')[:-1])
         File.createDirectory(path)
 
+    def writeInFolder(filename, write):
+        """
+        Makes sure filename's folder exists, then calls write. The folder usually comes
+        from createdDirectories without a syscall, so if something else deleted it since,
+        write raises FileNotFoundError. Then the deleted folders are forgotten and made
+        again, and write is retried once.
+        """
+        File.ensureFolderExists(filename)
+        try:
+            return write()
+        except FileNotFoundError:
+            path = '/'.join(filename.split('/')[:-1])
+            if path == "" or os.path.isdir(path): raise
+            # the highest folder that's gone, everything remembered under it is gone too
+            missing = path
+            while os.path.dirname(missing) not in ("", "/") and not os.path.isdir(os.path.dirname(missing)):
+                missing = os.path.dirname(missing)
+            File.forgetDirectories(missing)
+            File.createDirectory(path)
+            return write()
+
     def deleteFile(filename, confirm=True):
         if not File.exists(filename): return
         if confirm:
             if not Input.getBool(f"Delete {filename}?"):
                 raise ProgramException(f"Won't delete {filename}.")
         print(f"Deleting '{filename}'...", end='')
-        subprocess.Popen(f'rm {filename}', shell=True).wait()
+        os.remove(filename)
         print('done.')
 
     def copyDirectory(source, dest):
-        subprocess.Popen(f'cp -r {source} {dest}', shell=True).wait()
+        """Copies the contents of source into dest, creating dest if needed."""
+        shutil.copytree(source, dest, dirs_exist_ok=True)
         
     def deleteDirectory(filename):
         print(f"Deleting directory '{filename}'...", end='')
-        subprocess.Popen(f'rm -r {filename}', shell=True).wait()
+        shutil.rmtree(filename, ignore_errors=True)
+        File.forgetDirectories(filename.rstrip("/"))
         print("done.")
 
-    def getNames(directory):
+    def walk(directory, extension="png") -> dict[str, list[str]]:
+        """
+        Walks the tree under the given directory once, returning the relative names
+        of its files grouped by the directory holding them. Directories come parent
+        first, in listing order, and only ones with at least one matching file are
+        included.
+
+        Parameters
+        ----------
+        directory: str
+            Path of the directory to start from.
+        extension: str, optional
+            Only files with this extension are returned.
+            If extension None is passed in, all file names will be returned.
+        """
+        ret = {}
+        def visit(path):
+            files = []
+            folders = []
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            folders.append(entry.name)
+                        elif extension is None or File.hasExtension(entry.name, extension):
+                            files.append(f"{path}/{entry.name}")
+            except OSError:
+                return
+            if len(files) != 0:
+                ret[path] = files
+            for folder in folders:
+                visit(f"{path}/{folder}")
+        visit(directory)
+        return ret
+
+    def getFilesIn(directory, extension="png") -> list[str]:
+        """Like one directory's entry from File.walk, without looking into subdirectories."""
+        try:
+            with os.scandir(directory) as entries:
+                return [
+                    f"{directory}/{entry.name}" for entry in entries
+                    if not entry.is_dir()
+                    and (extension is None or File.hasExtension(entry.name, extension))
+                ]
+        except OSError:
+            return []
+
+    def getNames(directory, extension="png"):
         """
         Returns relative names of all files under the given directory,
         passing the condition passed in.
@@ -70,37 +157,46 @@ class File:
             Only files with this string as a suffix are returned.
             If extension None is passed in, all file names will be returned.
         """
-        ret = []
-        for path, folders, files in os.walk(directory):
-            for filename in files:
-                ret.append(f"{path}/{filename}")
-            for folder_name in folders:
-                ret.extend(File.getNames(f"{path}/{folder_name}"))
-            break
         return [
-            filename for filename in ret
-            if File.hasExtension(filename, "png")
+            filename
+            for filenames in File.walk(directory, extension).values()
+            for filename in filenames
         ]
     
     def getDirectories(directory):
-        allNames = File.getNames(directory)
-        ret = []
-        for name in allNames:
-            words = name.split("/")
-            newDir = "/".join(words[:-1])
-            if not newDir in ret:
-                ret.append(newDir)
-        return ret
+        """Returns every directory under the given one that holds at least one png."""
+        return list(File.walk(directory))
 
-    def getImage(filename):
+    @lru_cache(maxsize=4)
+    def getDecodedImage(filename, mtime):
+        """Decodes an image file. Cached by path and mtime, so it must not be modified."""
         image = Image.open(filename)
         ret = image.copy()
         image.close()
         return ret
 
+    def getImage(filename):
+        """Returns a copy of the image, only decoding the file again if it changed since last time."""
+        return File.getDecodedImage(filename, os.stat(filename).st_mtime_ns).copy()
+
     def saveImage(filename, image):
-        File.ensureFolderExists(filename)
-        image.save(filename)
+        File.writeInFolder(filename, lambda: image.save(filename))
+
+    def cropImageFile(filename) -> str:
+        """
+        Crops an image file in place to its non-transparent bounds.
+        Returns 'deleted' if it was fully transparent, 'unchanged' if it was already
+        cropped (the file isn't rewritten), and 'rewritten' otherwise.
+        """
+        image = File.getImage(filename)
+        cropped = Graphics.crop(image)
+        if cropped is None:
+            os.remove(filename)
+            return "deleted"
+        if cropped.size == image.size:
+            return "unchanged"
+        cropped.save(filename)
+        return "rewritten"
         
     def displayImageFile(filename):
         """Displays an image by filename. """
@@ -108,28 +204,105 @@ class File:
         subprocess.Popen(f'imgcat --height {File.height} "{filename}"', shell=True).wait()
 
     def displayImage(image):
-        """Displays an image by saving it as a temporary file and then using displayImageFile."""
+        """
+        Displays an image, inline from memory if the terminal supports it, and otherwise
+        by saving it as a temporary file and then using displayImageFile.
+        """
+        if File.supportsInlineImages():
+            File.displayImageInline(image)
+            return
         filename = "temp/temp0.png"
-        image.save(filename, "PNG")
+        File.writeInFolder(filename, lambda: image.save(filename, "PNG"))
         File.displayImageFile(filename)
 
+    def supportsInlineImages():
+        """Whether stdout is a terminal that reads iTerm2's inline image escape codes itself (not through tmux or screen)."""
+        if not sys.stdout.isatty(): return False
+        if "TMUX" in os.environ or os.environ.get("TERM", "").startswith("screen"): return False
+        return (
+            os.environ.get("TERM_PROGRAM") in ("iTerm.app", "WezTerm")
+            or os.environ.get("LC_TERMINAL") == "iTerm2"
+        )
+
+    def getTerminalPixelSize():
+        """Returns the terminal's width in pixels and the height of one row, or None if the terminal doesn't report them."""
+        try:
+            import fcntl
+            import termios
+            rows, _columns, width, height = struct.unpack(
+                "HHHH",
+                fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, bytes(8)),
+            )
+        except (ImportError, OSError):
+            return None
+        if rows == 0 or width == 0 or height == 0: return None
+        return width, height / rows
+
+    def displayImageInline(image):
+        """
+        Displays an image by writing it straight to stdout as an inline image escape code,
+        downscaled to what the terminal can show and encoded with fast PNG compression.
+        Previews are pixel art, so they're downscaled with nearest neighbor to keep edges
+        and labels sharp.
+        """
+        terminalSize = File.getTerminalPixelSize()
+        if terminalSize is not None:
+            maxWidth, rowHeight = terminalSize
+            maxSize = (maxWidth, int(File.height * rowHeight))
+            if image.width > maxSize[0] or image.height > maxSize[1]:
+                image = image.resize(
+                    Graphics.getSize(image.width, image.height, maxSize),
+                    Image.NEAREST,
+                )
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG", compress_level=1)
+        contents = buffer.getvalue()
+
+        sys.stdout.write("\033[H\033[2J\033[3J") # same as clear
+        sys.stdout.write(
+            f"\033]1337;File=inline=1;size={len(contents)};height={File.height};preserveAspectRatio=1:"
+            + base64.b64encode(contents).decode("ascii")
+            + "\a\n"
+        )
+        sys.stdout.flush()
+
     def getIndex(filename):
         return filename.split("/")[-1].replace(".png", "").replace(".json", "")
 
     def readText(filename, fallback):
         try:
-            file = open(filename, 'r')
-            return file.read()
+            with open(filename, 'r') as file:
+                return file.read()
         except:
             return fallback
         
     def writeText(filename, contents):
-        File.ensureFolderExists(filename)
+        def write():
+            with open(filename, "w") as file:
+                file.write(contents)
         print(f"Writing file {filename}...", end='')
-        file = open(filename, "w")
-        file.write(contents)
+        File.writeInFolder(filename, write)
         print("done.")
 
+    def writeTextAtomic(filename, contents):
+        """
+        Writes to a temporary file next to filename, then renames it over filename,
+        so anyone reading it (or a crash halfway through) sees either the old contents
+        or the new ones, never a truncated file.
+        """
+        temporary = f"{filename}.{os.getpid()}.tmp"
+        def write():
+            try:
+                with open(temporary, "w") as file:
+                    file.write(contents)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temporary, filename)
+            except:
+                if os.path.exists(temporary): os.remove(temporary)
+                raise
+        File.writeInFolder(filename, write)
+
     def writeJson(filename, data):
         File.writeText(filename, json.dumps(data))
 
@@ -153,6 +326,20 @@ class File:
     
     def hasUnpackingProgress(filename):
         return File.exists(File.getOutputDirectory(filename) + "/progress.json")
+
+    def recordDeletedSprite(filename):
+        """
+        Records in the progress.json next to a sprite deleted by hand that it was, so
+        finalizing its sheet doesn't save it again.
+        """
+        progressFilename = f"{os.path.dirname(filename)}/progress.json"
+        data = File.readJson(progressFilename)
+        if data is None: return
+        try: index = int(File.getIndex(filename))
+        except ValueError: return
+        deleted = data.get("deleted", [])
+        if index in deleted: return
+        File.writeTextAtomic(progressFilename, json.dumps({ **data, "deleted": deleted + [index] }))
     
     def isUnpacked(filename):
         return len(File.getOutputFiles(filename)) != 0
@@ -169,6 +356,34 @@ class File:
         )
         if caption != None: print(caption)
 
+    def getCaptionTile(filename: str, caption: str, aspectRatio: float=4):
+        """One sprite on its background, next to its index and caption. Cached on disk by TileCache."""
+        width, height = int(300*aspectRatio), 300
+        text = f"[{File.getIndex(filename)}]:\n{caption}"
+        return TileCache.get(
+            filename,
+            f"caption {width}x{height} {text}",
+            lambda: Graphics.withCaption(
+                Graphics.withBackground(
+                    File.getImage(filename)
+                ),
+                text,
+                width, height,
+            ),
+        )
+
+    def renderAllWithCaptions(
+        filenames: list[str],
+        captions: list[str],
+        aspectRatio: float=4,
+    ):
+        return Graphics.collect(
+            [
+                File.getCaptionTile(filenames[i], captions[i], aspectRatio)
+                for i in range(len(filenames))
+            ]
+        )
+
     def displayAllWithCaptions(
         filenames: list[str], 
         captions: list[str], 
@@ -176,17 +391,6 @@ class File:
         caption=None,
     ):
         File.displayImage(
-            Graphics.collect(
-                [
-                    Graphics.withCaption(
-                        Graphics.withBackground(
-                            File.getImage(filenames[i])
-                        ),
-                        f"[{File.getIndex(filenames[i])}]:\n{captions[i]}",
-                        int(300*aspectRatio), 300,
-                    )
-                    for i in range(len(filenames))
-                ]
-            )
+            File.renderAllWithCaptions(filenames, captions, aspectRatio)
         )
         if caption != None: print(caption)
\ No newline at end of file
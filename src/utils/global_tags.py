@@ -10,6 +10,18 @@ class GlobalTags:
 
     def __init__(self, data):
         self.data = data
+
+        # Inverted index: tag -> files with it, plus each file's position in
+        # self.data so that query results keep the manifest's order.
+        self.filesByTag: dict[str, set[str]] = {}
+        self.tagsByFile: dict[str, set[str]] = {}
+        self.order: dict[str, int] = {}
+        for position, filename in enumerate(data):
+            fileTags = set(data[filename])
+            self.order[filename] = position
+            self.tagsByFile[filename] = fileTags
+            for tag in fileTags:
+                self.filesByTag.setdefault(tag, set()).add(filename)
     
     def load():
         newData = {}
@@ -21,12 +33,9 @@ class GlobalTags:
         return GlobalTags(newData)
 
     def getDirectories(self) -> list[str]:
-        ret = []
-        for key in self.data:
-            directory = "/".join(key.split("/")[:-1])
-            if directory not in ret:
-                ret.append(directory)
-        return ret
+        return list(dict.fromkeys(
+            "/".join(key.split("/")[:-1]) for key in self.data
+        ))
     
     def getLocalTags(self, directory) -> LocalTags:
         tags = {}
@@ -34,7 +43,7 @@ class GlobalTags:
             index = filename.split("/")[-1].split(".")[0]
             if filename in self.data:
                 tags[index] = self.data[filename]
-        return LocalTags(
+        return LocalTags.fromData(
             directory,
             tags,
         )
@@ -51,45 +60,47 @@ class GlobalTags:
         except:
             return []
     
+    def inOrder(self, filenames) -> list[str]:
+        """Sorts a set of filenames by their position in the manifest."""
+        return sorted(filenames, key=self.order.__getitem__)
+
     def getAllTags(self):
-        filenames = list(self.data.keys())
-        tags = []
-        for filename in filenames:
-            fileTags = self.getFileTags(filename)
-            for tag in fileTags:
-                if tag not in tags:
-                    tags.append(tag)
-        return tags
+        tags = {}
+        for filename in self.data:
+            tags.update(dict.fromkeys(self.data[filename]))
+        return list(tags)
     
     def getSharedTags(self, tag):
-        filesWithTag = self.getFilesWithTag(tag)
-        ret = []
-        for file in filesWithTag:
-            others = self.getFileTags(file)
-            for other in others:
-                if other not in ret:
-                    ret.append(other)
-        return ret
+        ret = {}
+        for file in self.getFilesWithTag(tag):
+            ret.update(dict.fromkeys(self.data[file]))
+        return list(ret)
     
     def getFilesWithTag(self, tag):
-        filenames = list(self.data.keys())
-        ret = []
-        for filename in filenames:
-            if tag in self.getFileTags(filename):
-                ret.append(filename)
-        return ret
+        return self.inOrder(self.filesByTag.get(tag, ()))
     
     def getFilesWithTags(self, tags):
-        filenames = list(self.data.keys())
-        ret = []
-        for filename in filenames:
-            good = True
-            for tag in tags:
-                if tag not in self.getFileTags(filename):
-                    good = False
-                    break
-            if good:
-                ret.append(filename)
+        return self.inOrder(self.matching(tags, []))
+
+    def matching(self, includedTags, excludedTags) -> set[str]:
+        """
+        Returns the set of files having every included tag and none of the excluded ones.
+        Postings are intersected smallest first, so rare tags prune the search early.
+        """
+        if len(includedTags) == 0:
+            ret = set(self.data)
+        else:
+            postings = sorted(
+                [ self.filesByTag.get(tag, set()) for tag in set(includedTags) ],
+                key=len,
+            )
+            ret = set(postings[0])
+            for posting in postings[1:]:
+                if len(ret) == 0: break
+                ret &= posting
+        for tag in excludedTags:
+            if len(ret) == 0: break
+            ret -= self.filesByTag.get(tag, set())
         return ret
     
     def query(self, queryTags):
@@ -102,20 +113,4 @@ class GlobalTags:
         print(f"Including {includedTags}.")
         print(f"Excluding {excludedTags}.")
 
-        filenames = list(self.data.keys())
-        ret = []
-        for filename in filenames:
-            good = True
-            fileTags = self.getFileTags(filename)
-            for includedTag in includedTags:
-                if includedTag not in fileTags:
-                    good = False
-                    break
-            for excludedTag in excludedTags:
-                if excludedTag in fileTags:
-                    good = False
-                    break
-                    
-            if good:
-                ret.append(filename)
-        return ret
\ No newline at end of file
+        return self.inOrder(self.matching(includedTags, excludedTags))
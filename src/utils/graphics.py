@@ -1,26 +1,64 @@
 
+from functools import lru_cache
 from math import ceil, sqrt
+import os
 from PIL import Image, ImageDraw, ImageFont
 from textwrap import wrap
 
 class Graphics:
     """This class collects all of the image rendering used in the sprite unpacker."""
 
-    def getBackground(width, height):
-        image = Image.new('RGBA', (width, height), "#dddddd")
-        dim = 5
-        if max(width, height) > 50:
-            dim = 25
-        for i in range(ceil(width/dim)):
-            for j in range(ceil(height/dim)):
-                if (i+j)%2 == 0:
-                    Graphics.drawRect(image, i*dim, j*dim, dim-1, dim-1, stroke=None, fill="#eeeeee", lineWidth=0)
+    @lru_cache(maxsize=64)
+    def getCheckerboard(width, height, dim):
+        """
+        Builds the checkerboard by tiling one precomputed 2x2 cell tile, first across a
+        row strip and then down the image. The result is cached and shared between
+        callers, so it must not be drawn on.
+        """
+        tile = Image.new('RGBA', (2*dim, 2*dim), "#dddddd")
+        tile.paste("#eeeeee", (0, 0, dim, dim))
+        tile.paste("#eeeeee", (dim, dim, 2*dim, 2*dim))
+        return Graphics.tiled(tile, width, height)
+
+    def tiled(tile, width, height):
+        """Repeats a tile over a width x height image, with one paste per row and column."""
+        row = Image.new(tile.mode, (width, tile.height))
+        for x in range(0, width, tile.width):
+            row.paste(tile, (x, 0))
+        image = Image.new(tile.mode, (width, height))
+        for y in range(0, height, tile.height):
+            image.paste(row, (0, y))
         return image
+
+    def getBackgroundCellSize(width, height):
+        if max(width, height) > 50:
+            return 25
+        return 5
+
+    def getBackground(width, height):
+        return Graphics.getCheckerboard(
+            width, height,
+            Graphics.getBackgroundCellSize(width, height),
+        ).copy()
     
     def withBackground(image):
-        background = Graphics.getBackground(image.width, image.height)
+        background = Graphics.getCheckerboard(
+            image.width, image.height,
+            Graphics.getBackgroundCellSize(image.width, image.height),
+        )
         return Image.alpha_composite(background, image)
 
+    def withBackgroundCropped(image, ltrb):
+        """Same as withBackground(image).crop(ltrb), without compositing the rest of the image."""
+        background = Graphics.getCheckerboard(
+            image.width, image.height,
+            Graphics.getBackgroundCellSize(image.width, image.height),
+        )
+        return Image.alpha_composite(background.crop(ltrb), image.crop(ltrb))
+
+    def isOpaque(image):
+        return image.mode == 'RGBA' and image.getchannel('A').getextrema()[0] == 255
+
     def drawImageInRect(canvas, image, left, top, width, height, border="black"):
         size, = Graphics.getSize(image.width, image.height, (width, height)),
         image = Graphics.withSize(image, (width-2, height-2))
@@ -50,6 +88,16 @@ class Graphics:
         shape = [(left, top), (left+width, top+height)]
         ret.rectangle(shape, fill=fill, outline=stroke, width=lineWidth)
     
+    fontFilename = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..", "fonts", "roboto_mono_bold.ttf",
+    )
+
+    @lru_cache(maxsize=32)
+    def getFont(size):
+        """Loads the label font once per point size, keeping the most recently used sizes."""
+        return ImageFont.truetype(Graphics.fontFilename, size)
+
     def drawText(image, x, y, width, height, text, fill="black", bgColor="white"):
         draw = ImageDraw.Draw(image)
 
@@ -63,8 +111,11 @@ class Graphics:
             width / (maxLineLen * widthFactor),
             height / (len(lines) * heightFactor)
         )
+        # whole point sizes, so captions of similar lengths share a cached font, rounded
+        # down so the text never gets bigger than the size that fits
+        size = max(1, int(size))
 
-        font = ImageFont.truetype(r'./src/fonts/roboto_mono_bold.ttf', size)  
+        font = Graphics.getFont(size)
         textWidth = 0
         for line in text.split("\n"):
             textWidth = max(textWidth, draw.textlength(line, font=font))
@@ -82,14 +133,39 @@ class Graphics:
             Image.NEAREST
         )
         if(showGuides):
-            for i in range(image.width):
-                for j in range(image.height):
-                    stroke = "#bbbbbb"
-                    if i%5 == 0 and j%5 == 0: stroke = "black"
-                    if i%10 == 0 and j%10 == 0: stroke = "red"
-                    Graphics.drawRect(ret, i*factor, j*factor, 1, 1, stroke=stroke)
+            guides = Graphics.getGuides(image.width, image.height, factor)
+            ret.paste(guides, (0, 0), guides)
         return ret
-    
+
+    @lru_cache(maxsize=16)
+    def getGuidePattern(factor):
+        """
+        The guides for one 10x10 block of source pixels scaled by factor, which repeats
+        across every image. Cached and shared between callers, so it must not be drawn on.
+        """
+        # one dot color per source pixel, repeating every 10 pixels
+        colors = Image.new('RGBA', (10, 10), "#bbbbbb")
+        for i in (0, 5):
+            for j in (0, 5):
+                colors.putpixel((i, j), (0, 0, 0, 255))
+        colors.putpixel((0, 0), (255, 0, 0, 255))
+        colors = colors.resize((10*factor, 10*factor), Image.NEAREST)
+
+        # only the top left 2x2 of each scaled pixel is part of a dot
+        maskTile = Image.new('L', (factor, factor), 0)
+        maskTile.paste(255, (0, 0, min(2, factor), min(2, factor)))
+        colors.putalpha(Graphics.tiled(maskTile, 10*factor, 10*factor))
+        return colors
+
+    def getGuides(width, height, factor):
+        """
+        The guide overlay for a width x height image scaled by factor: a 2x2 dot at the
+        corner of every source pixel, black every 5 pixels and red every 10, transparent
+        elsewhere. Tiled from the cached pattern on every call, since the whole overlay is
+        as big as the scaled image.
+        """
+        return Graphics.tiled(Graphics.getGuidePattern(factor), width*factor, height*factor)
+
     def getSize(width, height, size):
         widthRatio = size[0]/width
         heightRatio = size[1]/height
@@ -97,7 +173,6 @@ class Graphics:
         return (int(ratio*width), int(ratio*height))
 
     def withSize(image, size):
-        print("Resizing?")
         resizing = Image.NEAREST
         # if image.width > size[0] or image.height > size[1]:
         #     resizing = Image.BICUBIC
@@ -111,20 +186,10 @@ class Graphics:
     def crop(image):
         """ Returns a cropped copy of the image, or None if the image is empty. """
         image = image.convert('RGBA')
-        left, right, top, bottom = image.width, 0, image.height, 0
-        empty = True
-        for i in range(image.width):
-            for j in range(image.height):
-                _r, _g, _b, a = image.getpixel((i, j))
-                if a != 0:
-                    left = min(left, i)
-                    right = max(right, i)
-                    top = min(top, j)
-                    bottom = max(bottom, j)
-                    empty = False
-        if(empty): return None
-        image = image.crop((left, top, right+1, bottom+1))
-        return image
+        # bounding box of every pixel with nonzero alpha, computed in C
+        bounds = image.getchannel('A').getbbox()
+        if bounds is None: return None
+        return image.crop(bounds)
     
     def withCaption(image, caption, width, height):
         textLength = 30
@@ -205,7 +270,8 @@ class Graphics:
             # draw sprite and rect of bounds
             Graphics.drawImageInRect(
                 canvas,
-                Graphics.withBackground(images[i]),
+                # images that are already opaque (e.g. given a background by the caller) can't change
+                images[i] if Graphics.isOpaque(images[i]) else Graphics.withBackground(images[i]),
                 tup[0]+pad+1, tup[1]+pad+1,
                 imgWidth-2*pad-2, imgHeight-2*pad-2,
             )
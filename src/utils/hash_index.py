@@ -0,0 +1,35 @@
+class HashIndex:
+    """
+    Finds the pairs of integer hashes that differ in at most radius bits, without
+    comparing every pair. By the pigeonhole principle, two hashes cut into radius+1
+    blocks that differ in at most radius bits match exactly on at least one block,
+    so only hashes that share a block value are compared.
+    """
+
+    def distance(a: int, b: int) -> int:
+        return (a ^ b).bit_count()
+
+    def getBlocks(bits: int, count: int) -> list[tuple[int, int]]:
+        """(shift, mask) for count blocks of as equal a size as possible covering bits bits."""
+        ret = []
+        start = 0
+        for i in range(count):
+            end = bits * (i + 1) // count
+            ret.append((start, (1 << (end - start)) - 1))
+            start = end
+        return ret
+
+    def getPairs(keys: list[int], radius: int, bits: int=64) -> set[tuple[int, int]]:
+        """Every (i, j) with i < j whose keys[i] and keys[j] differ in at most radius bits."""
+        ret = set()
+        for shift, mask in HashIndex.getBlocks(bits, min(radius + 1, bits)):
+            buckets = {}
+            for i, key in enumerate(keys):
+                buckets.setdefault((key >> shift) & mask, []).append(i)
+            for bucket in buckets.values():
+                for a in range(len(bucket)):
+                    for b in range(a + 1, len(bucket)):
+                        i, j = bucket[a], bucket[b]
+                        if HashIndex.distance(keys[i], keys[j]) <= radius:
+                            ret.add((i, j))
+        return ret
@@ -0,0 +1,114 @@
+import hashlib
+import json
+
+from utils.box import Box
+from utils.box_map import BoxMap
+from utils.file import File
+from utils.program_exception import ProgramException
+
+# The boxes one edit removed and added, by index.
+Diff = tuple[dict[int, Box], dict[int, Box]]
+
+class History:
+    """
+    Undo and redo stacks for the unpacker. Each step only stores the boxes that one
+    edit removed and added, and the oldest steps are dropped once the stacks hold
+    more than maxBoxes boxes in total.
+    """
+    maxBoxes = 50000
+
+    undoStack: list[Diff]
+    redoStack: list[Diff]
+
+    def __init__(self, undoStack: list[Diff], redoStack: list[Diff]):
+        self.undoStack = undoStack
+        self.redoStack = redoStack
+
+    def initial() -> 'History':
+        return History([], [])
+
+    def getFilename(directory: str) -> str:
+        return f"{directory}/history.json"
+
+    def fingerprint(sheetData) -> str:
+        return hashlib.sha1(json.dumps(sheetData).encode()).hexdigest()
+
+    def diffSize(diff: Diff) -> int:
+        removed, added = diff
+        return len(removed) + len(added)
+
+    def record(self, before: BoxMap, after: BoxMap) -> None:
+        """Remembers an edit from before to after. Making a new edit forgets everything that could be redone."""
+        diff = before.diff(after)
+        if History.diffSize(diff) == 0: return
+        self.undoStack.append(diff)
+        self.redoStack = []
+        self.trim()
+
+    def trim(self) -> None:
+        size = sum(History.diffSize(diff) for diff in self.undoStack + self.redoStack)
+        while size > History.maxBoxes and len(self.undoStack) > 0:
+            size -= History.diffSize(self.undoStack.pop(0))
+
+    def apply(target, removed: dict[int, Box], added: dict[int, Box]):
+        changes = { index: None for index in removed }
+        changes.update(added)
+        return target.withChanges(changes)
+
+    def undo(self, target, count: int=1):
+        """
+        Steps back count edits on target, which can be anything with a withChanges method
+        (a BoxMap or a Sheet), and returns the result.
+        """
+        if count > len(self.undoStack):
+            raise ProgramException(f"Only {len(self.undoStack)} action(s) to undo.")
+        for i in range(count):
+            diff = self.undoStack.pop()
+            self.redoStack.append(diff)
+            removed, added = diff
+            target = History.apply(target, added, removed)
+        return target
+
+    def redo(self, target, count: int=1):
+        if count > len(self.redoStack):
+            raise ProgramException(f"Only {len(self.redoStack)} action(s) to redo.")
+        for i in range(count):
+            diff = self.redoStack.pop()
+            self.undoStack.append(diff)
+            removed, added = diff
+            target = History.apply(target, removed, added)
+        return target
+
+    def diffToData(diff: Diff):
+        removed, added = diff
+        return {
+            "removed": [ removed[i].toData(i) for i in removed ],
+            "added": [ added[i].toData(i) for i in added ],
+        }
+
+    def diffFromData(data) -> Diff:
+        return (
+            { boxData["i"]: Box.fromData(boxData) for boxData in data["removed"] },
+            { boxData["i"]: Box.fromData(boxData) for boxData in data["added"] },
+        )
+
+    def save(self, directory: str, sheetData) -> None:
+        """Saves the stacks, tied to the sheet they lead up to so they're never replayed onto another one."""
+        File.writeJson(
+            History.getFilename(directory),
+            {
+                "sheet": History.fingerprint(sheetData),
+                "undo": [ History.diffToData(diff) for diff in self.undoStack ],
+                "redo": [ History.diffToData(diff) for diff in self.redoStack ],
+            },
+        )
+
+    def load(directory: str, sheetData) -> 'History':
+        """Loads the saved stacks, or an empty history if they were saved for a different sheet."""
+        data = File.readJson(History.getFilename(directory))
+        if data is None or data.get("sheet") != History.fingerprint(sheetData):
+            return History.initial()
+        return History(
+            [ History.diffFromData(diff) for diff in data["undo"] ],
+            [ History.diffFromData(diff) for diff in data["redo"] ],
+        )
@@ -1,88 +1,137 @@
+import json
 
-import copy
 from utils.file import File
+from utils.manifest_cache import ManifestCache
+from utils.write_behind import WriteBehind
 
 
 class LocalTags:
+    """
+    The tags of every sprite in one output directory, as saved in its tags.json.
+
+    Each index's tags are kept as an insertion-ordered set (a dict with None values),
+    so membership checks are O(1) and saving writes the lists back in the same order.
+    Edits return a new LocalTags that shares every index's tags it didn't touch.
+    """
     directory: str
-    tagsByIndex: dict[str, list[str]]
+    tagsByIndex: dict[str, dict[str, None]]
 
     def __init__(self, directory, tagsByIndex) -> 'LocalTags':
         self.directory = directory
         self.tagsByIndex = tagsByIndex
 
+    def fromData(directory: str, data: dict[str, list[str]]) -> 'LocalTags':
+        return LocalTags(
+            directory,
+            { index: dict.fromkeys(tags) for index, tags in data.items() },
+        )
+
+    def toData(self) -> dict[str, list[str]]:
+        return { index: list(tags) for index, tags in self.tagsByIndex.items() }
+
     def getIndices(self) -> list[str]:
         return self.tagsByIndex.keys()
 
     def getAll() -> list['LocalTags']:
-        directories = File.getDirectories("output")
+        """Loads the tags of every directory under output/, through the on-disk manifest cache."""
+        cache = ManifestCache.load()
+        directories = cache.getDirectories("output")
+        filenames = [ LocalTags.getFilename(directory) for directory in directories ]
         ret = []
-        for directory in directories:
+        for directory, filename in zip(directories, filenames):
             ret.append(
-                LocalTags.load(directory)
+                LocalTags.fromData(directory, cache.getTags(filename))
             )
+        cache.prune(filenames)
+        cache.save()
         return ret
 
     def initial(directory: str) -> 'LocalTags':
         return LocalTags(directory, {})
-    
+
     def getFilename(directory: str) -> str:
         return f"{directory}/tags.json"
-    
+
     def load(directory: str) -> 'LocalTags':
         filename = LocalTags.getFilename(directory)
-        return LocalTags(directory, File.readJson(filename, {}))
-        
+        # a save that's still waiting to be written is newer than the file
+        pending = WriteBehind.getPending(filename)
+        if pending is not None:
+            return LocalTags.fromData(directory, json.loads(pending))
+        return LocalTags.fromData(directory, File.readJson(filename, {}))
+
     def save(self) -> None:
         filename = LocalTags.getFilename(self.directory)
-        File.writeJson(filename, self.tagsByIndex)
+        File.writeJson(filename, self.toData())
+
+    def saveLater(self) -> None:
+        """Like save, but the file is written atomically on a background thread, see WriteBehind."""
+        WriteBehind.save(
+            LocalTags.getFilename(self.directory),
+            json.dumps(self.toData()),
+            File.writeTextAtomic,
+        )
+
+    def withChanges(
+        self,
+        indices: list[str],
+        addedTags: list[str]=(),
+        removedTags: list[str]=(),
+    ) -> 'LocalTags':
+        """
+        Removes removedTags from and then adds addedTags to every index, in one pass.
+        Only the indices whose tags actually change are copied, and if none do the same
+        LocalTags is returned. Removing from an index without tags doesn't add it.
+        """
+        changed = {}
+        for index in indices:
+            index = str(index)
+            if index in changed: continue
+            tags = self.tagsByIndex.get(index)
+            if tags is None:
+                if len(addedTags) == 0: continue
+                tags = {}
+            elif (
+                not any(tag in tags for tag in removedTags)
+                and all(tag in tags for tag in addedTags)
+            ): continue
+
+            newTags = dict(tags)
+            for tag in removedTags:
+                newTags.pop(tag, None)
+            # tags it already had keep their place
+            for tag in addedTags:
+                newTags[tag] = None
+            changed[index] = newTags
+
+        if len(changed) == 0: return self
+        newTagsByIndex = dict(self.tagsByIndex)
+        newTagsByIndex.update(changed)
+        return LocalTags(self.directory, newTagsByIndex)
 
     def withTag(self, index: str, tag: str) -> 'LocalTags':
-        index = str(index)
-        newTagsByIndex = copy.deepcopy(self.tagsByIndex)
-
-        if not index in newTagsByIndex: newTagsByIndex[index] = []
-        if tag in newTagsByIndex[index]: return self
-        newTagsByIndex[index].append(tag)
-
-        return LocalTags(self.directory, newTagsByIndex)
+        return self.withChanges([ index ], addedTags=[ tag ])
 
     def withoutTag(self, index: int, tag: str) -> 'LocalTags':
-        index = str(index)
-        newTagsByIndex = copy.deepcopy(self.tagsByIndex)
+        return self.withChanges([ index ], removedTags=[ tag ])
 
-        if not index in newTagsByIndex: return self
-        if not tag in newTagsByIndex[index]: return self
-        newTagsByIndex[index].remove(tag)
-
-        return LocalTags(self.directory, newTagsByIndex)
-    
     def withoutIndex(self, index: str) -> 'LocalTags':
         index = str(index)
         if not index in self.tagsByIndex: return self
-        
-        newTagsByIndex = copy.deepcopy(self.tagsByIndex)
-        del newTagsByIndex[str(index)]
+
+        newTagsByIndex = dict(self.tagsByIndex)
+        del newTagsByIndex[index]
         return LocalTags(self.directory, newTagsByIndex)
 
     def withTags(self, indices: list[str], tags: list[str]) -> 'LocalTags':
-        ret = self
-        for index in indices:
-            for tag in tags:
-                ret = ret.withTag(index, tag)
-        return ret
+        return self.withChanges(indices, addedTags=tags)
 
     def getTags(self, index: str) -> list[str]:
         index = str(index)
-        return self.tagsByIndex.get(index, [])
+        return list(self.tagsByIndex.get(index, ()))
 
     def withoutTags(self, indices: list[str], tags: list[str]) -> 'LocalTags':
-        ret = self
-        for index in indices:
-            for tag in tags:
-                ret = ret.withoutTag(index, tag)
-        return ret
+        return self.withChanges(indices, removedTags=tags)
 
     def toString(self) -> str:
-        return f"{self.directory}: {self.tagsByIndex}"
-    
\ No newline at end of file
+        return f"{self.directory}: {self.toData()}"
@@ -0,0 +1,131 @@
+import os
+from typing import Iterator
+
+from utils.file import File
+
+
+class ManifestCache:
+    """
+    An on-disk copy of every tags.json under output/, plus the directory listings
+    needed to find them. Entries are keyed by path and stat results, so a load only
+    re-lists directories whose mtime changed and re-parses manifests whose mtime or
+    size changed since the last run.
+    """
+    filename = "cache/manifest.json"
+
+    directories: dict[str, dict]
+    manifests: dict[str, dict]
+
+    def __init__(self, directories, manifests):
+        # path -> { "mtime", "subdirectories", "images" }, images is the number of pngs
+        self.directories = directories
+        # tags.json path -> { "mtime", "size", "tags" }
+        self.manifests = manifests
+        self.changed = False
+
+    def load() -> 'ManifestCache':
+        data = File.readJson(ManifestCache.filename, {})
+        return ManifestCache(
+            data.get("directories", {}),
+            data.get("manifests", {}),
+        )
+
+    def save(self) -> None:
+        if not self.changed: return
+        File.writeJson(
+            ManifestCache.filename,
+            {
+                "directories": self.directories,
+                "manifests": self.manifests,
+            },
+        )
+        self.changed = False
+
+    def listDirectory(self, directory: str, visited: dict[str, dict]) -> dict:
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        entry = self.directories.get(directory)
+        if entry is None or entry["mtime"] != mtime or "images" not in entry:
+            subdirectories = []
+            images = 0
+            with os.scandir(directory) as entries:
+                for dirEntry in entries:
+                    if dirEntry.is_dir():
+                        subdirectories.append(dirEntry.name)
+                    elif File.hasExtension(dirEntry.name, "png"):
+                        images += 1
+            entry = {
+                "mtime": mtime,
+                "subdirectories": subdirectories,
+                "images": images,
+            }
+            self.directories[directory] = entry
+            self.changed = True
+        visited[directory] = entry
+        return entry
+
+    def walk(self, root: str, visited: dict[str, dict]) -> Iterator[tuple[str, dict]]:
+        """
+        Yields (directory, entry) for root and every directory under it, parent first
+        in listing order like File.walk, only listing the ones that changed since they
+        were cached. It's lazy, so the walk goes only as far as the caller reads it.
+        """
+        entry = self.listDirectory(root, visited)
+        if entry is None: return
+        yield root, entry
+        for subdirectory in entry["subdirectories"]:
+            yield from self.walk(f"{root}/{subdirectory}", visited)
+
+    def getDirectories(self, root: str) -> list[str]:
+        """
+        Same result as File.getDirectories(root), but only lists the directories
+        that changed since they were cached.
+        """
+        visited = {}
+        ret = [
+            directory for directory, entry in self.walk(root, visited)
+            if entry["images"] > 0
+        ]
+        self.forgetUnvisited(root, visited)
+        return ret
+
+    def forgetUnvisited(self, root: str, visited: dict[str, dict]) -> None:
+        """After a complete walk of root, forgets the directories under it that are gone."""
+        stale = [
+            directory for directory in self.directories
+            if directory not in visited
+            and (directory == root or directory.startswith(f"{root}/"))
+        ]
+        for directory in stale:
+            del self.directories[directory]
+            self.changed = True
+
+    def getTags(self, filename: str) -> dict[str, list[str]]:
+        """Returns the parsed contents of a tags.json, re-reading it only if it changed."""
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            if filename in self.manifests:
+                del self.manifests[filename]
+                self.changed = True
+            return {}
+        entry = self.manifests.get(filename)
+        if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            entry = {
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "tags": File.readJson(filename, {}),
+            }
+            self.manifests[filename] = entry
+            self.changed = True
+        return entry["tags"]
+
+    def prune(self, filenames: list[str]) -> None:
+        """Forgets every cached manifest except the given ones."""
+        kept = set(filenames)
+        stale = [ filename for filename in self.manifests if filename not in kept ]
+        for filename in stale:
+            del self.manifests[filename]
+            self.changed = True
@@ -0,0 +1,92 @@
+from bisect import bisect_right
+from math import ceil
+
+from utils.file import File
+from utils.manifest_cache import ManifestCache
+
+
+class PageIndex:
+    """
+    The tagger's pages of pngs under a root directory, pageSize at a time, one
+    directory after another in File.walk order. Directories are only walked as far
+    as the pages asked for, using the image counts ManifestCache keeps per directory
+    so unchanged directories aren't listed again, and a directory's files are only
+    listed and sorted when one of its pages is shown.
+    """
+    # how many directories' files are kept listed, enough for a page and its neighbors
+    maxListed = 3
+
+    root: str
+    pageSize: int
+
+    def __init__(self, root: str, pageSize: int):
+        self.root = root
+        self.pageSize = pageSize
+        self.cache = ManifestCache.load()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets every page, so they're found again from a fresh walk after files change."""
+        self.visited = {}
+        self.walker = self.cache.walk(self.root, self.visited)
+        # directories with at least one png, and the index of each one's first page
+        self.directories = []
+        self.firstPages = []
+        self.pageCount = 0
+        self.complete = False
+        # directory -> sorted filenames, for the last few directories pages were taken from
+        self.listed = {}
+
+    def ensure(self, pageIndex: int) -> None:
+        """
+        Walks on until pageIndex exists or there's nothing left to walk. The cache is
+        saved once the walk is complete, so paging doesn't rewrite it at every step.
+        """
+        while not self.complete and self.pageCount <= pageIndex:
+            step = next(self.walker, None)
+            if step is None:
+                self.complete = True
+                self.cache.forgetUnvisited(self.root, self.visited)
+                self.cache.save()
+                break
+            directory, entry = step
+            if entry["images"] == 0: continue
+            self.directories.append(directory)
+            self.firstPages.append(self.pageCount)
+            self.pageCount += ceil(entry["images"] / self.pageSize)
+
+    def clamp(self, pageIndex: int) -> int:
+        """The closest existing page to pageIndex, or -1 if there are none."""
+        self.ensure(pageIndex)
+        return max(0, min(pageIndex, self.pageCount - 1)) if self.pageCount != 0 else -1
+
+    def isLast(self, pageIndex: int) -> bool:
+        self.ensure(pageIndex + 1)
+        return pageIndex >= self.pageCount - 1
+
+    def getTotal(self) -> str:
+        """The number of pages, with a + while there may be more that weren't walked yet."""
+        return f"{self.pageCount}" if self.complete else f"{self.pageCount}+"
+
+    def getFilenameKey(filename: str):
+        key = File.getIndex(filename)
+        try: return int(key)
+        except: return key
+
+    def getPage(self, pageIndex: int) -> tuple[str, list[int]]:
+        """Returns the directory and the sprite indices on an existing page."""
+        self.ensure(pageIndex)
+        i = bisect_right(self.firstPages, pageIndex) - 1
+        directory = self.directories[i]
+        filenames = self.listed.get(directory)
+        if filenames is None:
+            filenames = File.getFilesIn(directory)
+            filenames.sort(key=PageIndex.getFilenameKey)
+            self.listed[directory] = filenames
+            if len(self.listed) > PageIndex.maxListed:
+                del self.listed[next(iter(self.listed))]
+        start = (pageIndex - self.firstPages[i]) * self.pageSize
+        return directory, [
+            int(filename.split("/")[-1].split('.')[0])
+            for filename in filenames[start : start + self.pageSize]
+        ]
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+import os
+import threading
+
+from utils.file import File
+from utils.graphics import Graphics
+
+
+class PageRenderer:
+    """
+    Renders the tagger's pages, and renders the ones it's told to prefetch ahead of
+    time on a background thread, so stepping to them only has to display them.
+
+    Rendered pages are kept by their filenames, captions and file mtimes, so a page
+    whose tags or sprites changed since is never shown stale, and only the maxPages
+    most recently used ones are kept. A prefetch that's no longer wanted is cancelled
+    between tiles.
+    """
+    maxPages = 8
+
+    def __init__(self):
+        # key -> rendered page, least recently used first
+        self.rendered = OrderedDict()
+        # (key, filenames, captions) for the thread to render, in order
+        self.queue = []
+        # keys of the pages the last prefetch asked for, anything else the thread is rendering gets cancelled
+        self.wanted = set()
+        # key of the page the thread is rendering right now
+        self.rendering = None
+        self.condition = threading.Condition()
+        # fonts can't be drawn with from two threads at once, so tiles are drawn one at a time
+        self.drawing = threading.Lock()
+        self.thread = None
+
+    def getKey(filenames: list[str], captions: list[str]) -> tuple:
+        mtimes = []
+        for filename in filenames:
+            try: mtimes.append(os.stat(filename).st_mtime_ns)
+            except OSError: mtimes.append(None)
+        return (tuple(filenames), tuple(captions), tuple(mtimes))
+
+    def render(self, filenames: list[str], captions: list[str], isCancelled=lambda: False):
+        """Same as File.renderAllWithCaptions, or None if isCancelled returned True between tiles."""
+        tiles = []
+        for filename, caption in zip(filenames, captions):
+            if isCancelled(): return None
+            with self.drawing:
+                tiles.append(File.getCaptionTile(filename, caption))
+        with self.drawing:
+            return Graphics.collect(tiles)
+
+    def store(self, key: tuple, image) -> None:
+        """Keeps a rendered page, forgetting the least recently used ones past maxPages. Call with the condition held."""
+        self.rendered[key] = image
+        self.rendered.move_to_end(key)
+        while len(self.rendered) > PageRenderer.maxPages:
+            self.rendered.popitem(last=False)
+
+    def get(self, filenames: list[str], captions: list[str]):
+        """
+        Returns the rendered page, from the cache or the thread if it's already
+        rendering it, and otherwise cancels any prefetching and renders it right away.
+        """
+        key = PageRenderer.getKey(filenames, captions)
+        with self.condition:
+            while self.rendering == key:
+                self.condition.wait()
+            if key in self.rendered:
+                self.rendered.move_to_end(key)
+                return self.rendered[key]
+            self.wanted = set()
+            self.queue = []
+        image = self.render(filenames, captions)
+        with self.condition:
+            self.store(key, image)
+        return image
+
+    def prefetch(self, pages: list[tuple[list[str], list[str]]]) -> None:
+        """
+        Renders the given (filenames, captions) pages on the thread, in order, in place
+        of whatever the last prefetch asked for.
+        """
+        jobs = [ (PageRenderer.getKey(filenames, captions), filenames, captions) for filenames, captions in pages ]
+        with self.condition:
+            self.wanted = { key for key, _filenames, _captions in jobs }
+            self.queue = [
+                job for job in jobs
+                if job[0] not in self.rendered and job[0] != self.rendering
+            ]
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run,
+                    name="PageRenderer",
+                    daemon=True,
+                )
+                self.thread.start()
+            self.condition.notify_all()
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while len(self.queue) == 0:
+                    self.condition.wait()
+                key, filenames, captions = self.queue.pop(0)
+                self.rendering = key
+            try:
+                image = self.render(filenames, captions, lambda: key not in self.wanted)
+            except Exception:
+                # e.g. a sprite deleted since, get renders the page itself if it's still needed
+                image = None
+            with self.condition:
+                self.rendering = None
+                if image is not None: self.store(key, image)
+                self.condition.notify_all()
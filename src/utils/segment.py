@@ -0,0 +1,226 @@
+import numpy as np
+
+from utils.box import Box
+
+
+class Segment:
+    """
+    Finds sprites on a sheet automatically, as the connected groups of non-transparent
+    pixels in its alpha channel. Needs numpy.
+    """
+
+    def getRuns(mask):
+        """
+        Returns (rows, starts, ends) of every horizontal run of True pixels in a 2D bool
+        array, with ends inclusive, sorted by row and then by start.
+        """
+        height, width = mask.shape
+        padded = np.zeros((height, width + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        edges = np.diff(padded, axis=1)
+        rows, starts = np.nonzero(edges == 1)
+        _rows, ends = np.nonzero(edges == -1)
+        return rows, starts, ends - 1
+
+    def getTouchingRuns(rows, starts, ends, width):
+        """
+        Returns pairs of indices (upper, lower) of runs on neighboring rows that touch,
+        counting diagonal neighbors. Found with binary searches instead of comparing
+        every pair of runs.
+        """
+        # one number per run end/start that sorts by row and then by column
+        stride = width + 2
+        endKeys = rows * stride + ends
+        startKeys = rows * stride + starts
+        previousRow = (rows - 1) * stride
+        # runs on the row above that end at or after this run's start-1...
+        lo = np.searchsorted(endKeys, previousRow + starts - 1, side='left')
+        # ...and start at or before this run's end+1
+        hi = np.searchsorted(startKeys, previousRow + ends + 1, side='right')
+        counts = np.maximum(hi - lo, 0)
+        lower = np.repeat(np.arange(len(rows)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        upper = np.repeat(lo, counts) + offsets
+        return upper, lower
+
+    def getLabels(count, upper, lower):
+        """
+        Returns a component label per run, the lowest run index in its component.
+        Each round hooks the larger label of every touching pair onto the smaller one,
+        then follows pointers until every run points straight at its root, so the whole
+        thing is a few passes of array operations rather than a loop over pairs.
+        """
+        labels = np.arange(count)
+        while True:
+            upperLabels = labels[upper]
+            lowerLabels = labels[lower]
+            different = upperLabels != lowerLabels
+            if not different.any(): return labels
+            upperLabels = upperLabels[different]
+            lowerLabels = lowerLabels[different]
+            np.minimum.at(
+                labels,
+                np.maximum(upperLabels, lowerLabels),
+                np.minimum(upperLabels, lowerLabels),
+            )
+            while True:
+                jumped = labels[labels]
+                if np.array_equal(jumped, labels): break
+                labels = jumped
+
+    def getBoxes(image, gap: int=0) -> list[Box]:
+        """
+        Returns the bounding box of every group of non-transparent pixels, in reading order.
+        Pixels touching (diagonally too) are grouped, and so are groups with no more than
+        gap transparent pixels between them.
+        """
+        alpha = np.asarray(image.convert('RGBA').getchannel('A')) != 0
+        height, width = alpha.shape
+
+        # Grow every pixel right and down by gap, into padding, so groups within gap of
+        # each other touch. Lefts and tops are unchanged, rights and bottoms grow by gap.
+        mask = np.zeros((height + gap, width + gap), dtype=bool)
+        mask[:height, :width] = alpha
+        grown = mask.copy()
+        for offset in range(1, gap + 1):
+            grown[:, offset:] |= mask[:, :-offset]
+        mask = grown.copy()
+        for offset in range(1, gap + 1):
+            mask[offset:, :] |= grown[:-offset, :]
+        rows, starts, ends = Segment.getRuns(mask)
+        if len(rows) == 0: return []
+
+        upper, lower = Segment.getTouchingRuns(rows, starts, ends, mask.shape[1])
+        labels = Segment.getLabels(len(rows), upper, lower)
+
+        # bounds of each label's runs
+        uniqueLabels, labels = np.unique(labels, return_inverse=True)
+        count = len(uniqueLabels)
+        lefts = np.full(count, np.iinfo(np.int64).max)
+        tops = np.full(count, np.iinfo(np.int64).max)
+        rights = np.full(count, -1)
+        bottoms = np.full(count, -1)
+        np.minimum.at(lefts, labels, starts)
+        np.minimum.at(tops, labels, rows)
+        np.maximum.at(rights, labels, ends + 1 - gap)
+        np.maximum.at(bottoms, labels, rows + 1 - gap)
+
+        order = np.lexsort((lefts, tops))
+        return [
+            Box.fromLTRB(int(lefts[i]), int(tops[i]), int(rights[i]), int(bottoms[i]))
+            for i in order
+        ]
+
+    def getRanks(values):
+        """
+        Returns each value's rank among the others scaled into (0, 1), tied values sharing
+        their average rank. NaNs stay NaN and aren't ranked.
+        """
+        ranks = np.full(values.shape, np.nan)
+        known = ~np.isnan(values)
+        order = np.argsort(values[known], kind='stable')
+        _unique, starts, counts = np.unique(values[known][order], return_index=True, return_counts=True)
+        sortedRanks = np.repeat(starts + (counts - 1) / 2, counts)
+        knownRanks = np.empty(len(order))
+        knownRanks[order] = sortedRanks
+        ranks[known] = (knownRanks + 0.5) / len(order)
+        return ranks
+
+    def getEdgeStrengths(pixels):
+        """
+        Returns how sharply a (height, width, 4) RGBA array changes across each vertical
+        line between two columns, as the mean difference in premultiplied color and alpha
+        over the rows where either side is non-transparent. Entry x-1 is the line before
+        column x, and lines with nothing next to them are NaN.
+        """
+        alpha = pixels[..., 3:4]
+        premultiplied = pixels[..., :3] * alpha // 255
+        difference = (
+            np.abs(np.diff(premultiplied, axis=1)).sum(axis=2)
+            + np.abs(np.diff(alpha[..., 0], axis=1))
+        )
+        opaque = alpha[..., 0] != 0
+        counts = (opaque[:, 1:] | opaque[:, :-1]).sum(axis=0)
+        return np.where(counts != 0, difference.sum(axis=0) / np.maximum(counts, 1), np.nan)
+
+    def getPitchScores(strengths, minPitch: int=8, minCuts: int=3, evenBonus: float=1):
+        """
+        Scores every pitch from minPitch up for lines between columns, from their edge
+        strengths. Returns (pitches, scores, offsets), the offset being where the pitch's
+        cuts score best. Strengths are ranked, and a pitch's score is how far the mean rank
+        of its cuts sits above a random set of cuts of that size, in standard deviations,
+        so a long pitch with a couple of lucky cuts doesn't beat a short one that's sharp
+        all the way along. Pitches that divide the size evenly get evenBonus on top, as
+        sheets are usually a whole number of tiles, and a pitch needs minCuts cuts.
+        """
+        ranks = Segment.getRanks(strengths)
+        known = ~np.isnan(ranks)
+        ranks = np.where(known, ranks, 0)
+        size = len(strengths) + 1
+        positions = np.arange(1, size)
+
+        pitches = []
+        scores = []
+        offsets = []
+        for pitch in range(minPitch, size // minCuts + 1):
+            counts = np.bincount(positions % pitch, known, pitch)
+            totals = np.bincount(positions % pitch, ranks, pitch)
+            # a uniform rank has mean 1/2 and variance 1/12
+            pitchScores = np.where(
+                counts >= minCuts,
+                (totals / np.maximum(counts, 1) - 0.5) * np.sqrt(12 * counts),
+                -np.inf,
+            )
+            offset = int(pitchScores.argmax())
+            if pitchScores[offset] == -np.inf: continue
+            pitches.append(pitch)
+            scores.append(pitchScores[offset] + (evenBonus if size % pitch == 0 else 0))
+            offsets.append(offset)
+        return np.array(pitches, dtype=int), np.array(scores), np.array(offsets, dtype=int)
+
+    def getFundamental(pitches, scores, tolerance: float=0.9):
+        """
+        Returns the index of the best scoring pitch, or of the shortest pitch dividing it
+        that scores at least tolerance of it, so a 16 pixel grid isn't reported as 32.
+        """
+        best = int(scores.argmax())
+        for i in range(len(pitches)):
+            if pitches[best] % pitches[i] == 0 and scores[i] >= tolerance * scores[best]:
+                return i
+        return best
+
+    def getGrid(image, box: Box, minScore: float=3, share: float=0.7):
+        """
+        Returns ((pitchX, offsetX), (pitchY, offsetY)) for the tile grid most likely used
+        inside box, from where the colors change sharply between columns and between rows,
+        see getPitchScores. Either is None when no pitch along that axis scores minScore.
+        When the same pitch along both axes scores at least share of the two best pitches
+        together, it's used for both, as tiles are usually square.
+        """
+        region = image.convert('RGBA').crop(box.getLTRB())
+        pixels = np.asarray(region).astype(np.int32)
+        axes = [
+            Segment.getPitchScores(Segment.getEdgeStrengths(pixels)),
+            Segment.getPitchScores(Segment.getEdgeStrengths(pixels.transpose(1, 0, 2))),
+        ]
+        grid = [None, None]
+        bestScores = [0, 0]
+        for axis, (pitches, scores, offsets) in enumerate(axes):
+            if len(pitches) == 0: continue
+            i = Segment.getFundamental(pitches, scores)
+            bestScores[axis] = max(scores[i], 0)
+            if scores[i] >= minScore:
+                grid[axis] = (int(pitches[i]), int(offsets[i]))
+
+        (pitchesX, scoresX, offsetsX), (pitchesY, scoresY, offsetsY) = axes
+        common, indicesX, indicesY = np.intersect1d(pitchesX, pitchesY, return_indices=True)
+        if len(common) != 0:
+            scores = scoresX[indicesX] + scoresY[indicesY]
+            i = Segment.getFundamental(common, scores)
+            # the sum of two independent scores, scaled back to one standard deviation
+            if scores[i] / np.sqrt(2) >= minScore and scores[i] >= share * sum(bestScores):
+                grid = [
+                    (int(common[i]), int(offsetsX[indicesX[i]])),
+                    (int(common[i]), int(offsetsY[indicesY[i]])),
+                ]
+        return tuple(grid)
@@ -1,19 +1,27 @@
-import copy
+import json
+import os
 from typing import Literal
 
 import PIL
 from utils.box import Box, Side
+from utils.box_grid import BoxGrid
+from utils.box_map import BoxMap
 from utils.graphics import Graphics
 from utils.file import File
+from utils.segment import Segment
 
 class Sheet:
     """Handles a list of subsprites, and operations on that list"""
 
     filename: str
-    boxes: dict[int, Box]
+    boxes: BoxMap
+    grid: BoxGrid
 
-    def __init__(self, filename: str, boxes: dict[int, Box]):
+    def __init__(self, filename: str, boxes: BoxMap | dict[int, Box], grid: BoxGrid=None):
+        if isinstance(boxes, dict): boxes = BoxMap.fromDict(boxes)
+        if grid is None: grid = BoxGrid.fromBoxes(boxes)
         self.boxes = boxes
+        self.grid = grid
         self.filename = filename
 
     def fromData(data):
@@ -28,7 +36,7 @@ class Sheet:
     def toData(self):
         return {
             "filename": self.filename,
-            "boxes": [ self.boxes[i].toData(i) for i in self.boxes]
+            "boxes": [ box.toData(i) for i, box in self.boxes.items() ]
         }
 
     def initial(filename: str):
@@ -40,39 +48,48 @@ class Sheet:
             { 0: Box(0, 0, imgWidth, imgHeight) },
         )
     
+    def withChanges(self, changes: dict[int, Box | None]):
+        """Sets or (with None) removes the box at each index, keeping the grid in step."""
+        return Sheet(
+            self.filename,
+            self.boxes.withChanges(changes),
+            self.grid.withChanges(self.boxes, changes),
+        )
+
+    def segmented(filename: str, gap: int=0):
+        """A sheet with one box around each group of non-transparent pixels, see Segment.getBoxes."""
+        return Sheet(filename, {}).withBoxes(
+            Segment.getBoxes(File.getImage(filename), gap)
+        )
+
     def withoutBox(self, index: int):
-        newBoxes = copy.deepcopy(self.boxes)
-        del newBoxes[index]
-        return Sheet(self.filename, newBoxes)
+        return self.withoutBoxes([index])
     
     def withoutBoxes(self, indices: list[int]):
-        newBoxes = copy.deepcopy(self.boxes)
         for index in indices:
-            del newBoxes[index]
-        return Sheet(self.filename, newBoxes)
+            if index not in self.boxes: raise KeyError(index)
+        return self.withChanges({ index: None for index in indices })
     
     def withBox(self, addedBox: Box):
-        newBoxes = copy.deepcopy(self.boxes)
-        index = 0
-        while index in self.boxes:
-            index += 1
-        newBoxes[index] = addedBox
-        return Sheet(self.filename, newBoxes)
+        return self.withBoxes([addedBox])
 
     def withBoxes(self, addedBoxes: list[Box]):
-        ret = self
-        for addedBox in addedBoxes:
-            ret = ret.withBox(addedBox)
-        return ret
+        indices = self.boxes.nextIndices(len(addedBoxes))
+        return self.withChanges(dict(zip(indices, addedBoxes)))
+
+    def getIntersecting(self, region: Box) -> list[int]:
+        """Indices of the boxes intersecting region, in index order."""
+        return self.grid.getIntersecting(self.boxes, region)
+
+    def getBoxesAt(self, x: int, y: int) -> list[int]:
+        """Indices of the boxes containing the pixel (x, y), in index order."""
+        return self.grid.getContaining(self.boxes, x, y)
 
     def merge(self, index1: int, index2: int):
         box1 = self.boxes[index1]
         box2 = self.boxes[index2]
         newBox = box1.getBoundsOnce(box2)
-        indicesToRemove = [
-            index for index in self.boxes.keys()
-            if self.boxes[index].intersects(newBox)
-        ]
+        indicesToRemove = self.getIntersecting(newBox)
         return self.withoutBoxes(indicesToRemove).withBox(newBox)
     
     def getSliced(self, index: int, wide: int, tall: int):
@@ -81,6 +98,17 @@ class Sheet:
         ret = ret.withBoxes(self.boxes[index].getSliced(wide, tall))
         return ret
     
+    def getGridSliced(self, index: int, pitchX: int, pitchY: int, offsetX: int=0, offsetY: int=0):
+        ret = self
+        ret = ret.withoutBox(index)
+        ret = ret.withBoxes(self.boxes[index].getGridSliced(pitchX, pitchY, offsetX, offsetY))
+        return ret
+
+    def detectGrid(self, index: int, image: PIL.Image=None):
+        """The likely tile grid inside a box, see Segment.getGrid."""
+        if image is None: image = File.getImage(self.filename)
+        return Segment.getGrid(image, self.boxes[index])
+
     def getCut(self, index: int, side: Side, pixels: int):
         ret = self
         ret = ret.withoutBox(index)
@@ -88,25 +116,22 @@ class Sheet:
         return ret
     
     def getShifted(self, index: int, side: Side, pixels: int):
-        newBoxes = copy.deepcopy(self.boxes)
-
         # update the one actually being shifted...
         newBox = self.boxes[index].getShifted(side, pixels)
-        newBoxes[index] = newBox
+        changes = { index: newBox }
 
         # Then try to correct intersections...
-        for otherIndex in newBoxes:
+        for otherIndex in self.getIntersecting(newBox):
             if index == otherIndex: continue
-            box = newBoxes[otherIndex]
-            if box.intersects(newBox):
-                newValue = newBox.getSide(side)
-                newBoxes[otherIndex] = box.withSide(Box.opposite(side), newValue)
+            box = self.boxes[otherIndex]
+            newValue = newBox.getSide(side)
+            changes[otherIndex] = box.withSide(Box.opposite(side), newValue)
 
         # Done!
-        return Sheet(self.filename, newBoxes)
+        return self.withChanges(changes)
     
-    def getSubimage(self, index: int):
-        image = File.getImage(self.filename)
+    def getSubimage(self, index: int, image: PIL.Image=None):
+        if image is None: image = File.getImage(self.filename)
         subsprite = self.boxes[index]
         return image.crop(
             (
@@ -143,24 +168,123 @@ class Sheet:
         ]
         return Box.getBounds(boxes)
         
+    def getRenderRegion(self, image: PIL.Image, viewport: Box):
+        """
+        The part of the image that has to be rendered to show the viewport: the viewport
+        clipped to the image, with its top left pulled back to a multiple of 10 so the
+        scale guides line up the same as on the whole image.
+        """
+        left = max(0, viewport.left - viewport.left % 10)
+        top = max(0, viewport.top - viewport.top % 10)
+        right = min(image.width, viewport.right)
+        bottom = min(image.height, viewport.bottom)
+        if left >= right or top >= bottom:
+            return Box(0, 0, image.width, image.height)
+        return Box.fromLTRB(left, top, right, bottom)
+
     def drawOn(self, image: PIL.Image, viewport: Box):
-        image = Graphics.withBackground(image)
         factor = 6
-        size = max(viewport.width, viewport.height)
-        disp = Graphics.scale(image, factor, size)
-        for index in self.boxes:
+        region = self.getRenderRegion(image, viewport)
+        disp = Graphics.scale(
+            Graphics.withBackgroundCropped(image, region.getLTRB()),
+            factor,
+        )
+        for index in self.getIntersecting(region):
             box = self.boxes[index]
-            box.scale(factor).drawOn(disp, f"{index}")
-        File.displayImage(disp.crop(viewport.scale(factor).getLTRB()))
+            box.translate(-region.left, -region.top).scale(factor).drawOn(disp, f"{index}")
+        File.displayImage(
+            disp.crop(
+                viewport.translate(-region.left, -region.top).scale(factor).getLTRB()
+            )
+        )
 
-    def saveFinalImages(self):
-        for index in self.boxes:
-            subimage = Graphics.crop(self.getSubimage(index))
+    def saveFinalImages(self, indices: list[int]=None, verbose: bool=True):
+        """
+        Saves the sprite in every box, or only in the given ones. A box that's empty has
+        its sprite deleted, in case it was saved before.
+        """
+        if indices is None: indices = self.boxes
+        image = File.getImage(self.filename)
+        for index in indices:
+            subimage = Graphics.crop(self.getSubimage(index, image))
             subfilename = self.getSubpath(index)
 
             if subimage is None:
-                print(f"Skipping {subfilename} bc its empty")
+                if verbose: print(f"Skipping {subfilename} bc its empty")
+                if File.exists(subfilename): os.remove(subfilename)
                 continue
 
-            print(f"Saving {subfilename}.")
+            if verbose: print(f"Saving {subfilename}.")
             File.saveImage(subfilename, subimage)
+
+    def getProgressFilename(self):
+        return f"{self.getDirectory()}/progress.json"
+
+    def getProgressData(self, done: bool=False):
+        """
+        What progress.json holds. A sheet marked done also lists the indices of the
+        sprites deleted by hand since, none yet, as marking it done saves every one.
+        """
+        data = { **self.toData(), "done": done }
+        if done: data["deleted"] = []
+        return data
+
+    def unmarkDone(progressFilename: str) -> None:
+        data = File.readJson(progressFilename)
+        if data is None: return
+        data["done"] = False
+        data.pop("deleted", None)
+        File.writeTextAtomic(progressFilename, json.dumps(data))
+
+    def getEmptyIndices(self, indices: list[int], image: PIL.Image=None) -> list[int]:
+        if image is None: image = File.getImage(self.filename)
+        return [ index for index in indices if Graphics.crop(self.getSubimage(index, image)) is None ]
+
+    def isSavedSince(self, indices: list[int], progressFilename: str) -> bool:
+        """
+        Whether the sprites of indices are all newer than both the source png and
+        progressFilename. Boxes without a sprite only count if they're empty.
+        """
+        newest = max(os.path.getmtime(self.filename), os.path.getmtime(progressFilename))
+        missing = []
+        for index in indices:
+            subfilename = self.getSubpath(index)
+            if not File.exists(subfilename):
+                missing.append(index)
+            elif os.path.getmtime(subfilename) < newest:
+                return False
+        return len(missing) == 0 or len(self.getEmptyIndices(missing)) == len(missing)
+
+    def migrateProgress(self, progressFilename: str, data) -> dict:
+        """
+        Marks a sheet saved before progress.json said whether it's done, as done if it
+        has any sprites, and records its missing non-empty sprites as deleted by hand.
+        Returns the new data, which is written back so this only happens once.
+        """
+        missing = [ index for index in self.boxes if not File.exists(self.getSubpath(index)) ]
+        if len(missing) == len(self.boxes): return data
+        empty = set(self.getEmptyIndices(missing))
+        deleted = set(data.get("deleted", [])) | { index for index in missing if index not in empty }
+        data = { **data, "done": True, "deleted": sorted(deleted) }
+        File.writeTextAtomic(progressFilename, json.dumps(data))
+        return data
+
+    def finalize(progressFilename: str, force: bool=False) -> str:
+        """
+        Resaves the sprites of a sheet marked done, from its progress.json and without
+        displaying anything, unless they're already newer than both it and the source png
+        (or force is set). Every box is saved except the ones progress.json lists as
+        deleted by hand, and sprites whose box is now empty are deleted.
+        Returns what happened, for Batch.summarize.
+        """
+        data = File.readJson(progressFilename)
+        sheet = Sheet.fromData(data)
+        if not File.exists(sheet.filename): return "missing source"
+        if "done" not in data: data = sheet.migrateProgress(progressFilename, data)
+        # saved but never marked done, finalizing is left to the unpacker
+        if not data.get("done", False): return "not done"
+        deleted = set(data.get("deleted", []))
+        indices = [ index for index in sheet.boxes if index not in deleted ]
+        if not force and sheet.isSavedSince(indices, progressFilename): return "up to date"
+        sheet.saveFinalImages(indices, verbose=False)
+        return "finalized"
@@ -0,0 +1,138 @@
+import hashlib
+import os
+
+from PIL import Image
+
+from utils.batch import Batch
+from utils.file import File
+from utils.graphics import Graphics
+from utils.hash_index import HashIndex
+
+
+class SpriteHashes:
+    """
+    An on-disk cache of two hashes per sprite png, keyed by path and stat results
+    so a run only decodes the sprites that changed since the last one: an exact
+    hash of the cropped RGBA pixels, and a 64 bit difference hash (dHash) of a small
+    grayscale copy, which only changes in a few bits for near-duplicates like
+    recolors or seasonal variants.
+    """
+    filename = "cache/sprite_hashes.json"
+    # the perceptual hash compares hashSize+1 x hashSize pixels, for hashSize^2 bits
+    hashSize = 8
+
+    sprites: dict[str, dict]
+
+    def __init__(self, sprites):
+        # png path -> { "mtime", "size", "exact", "perceptual" }, hashes are None for empty pngs
+        self.sprites = sprites
+        self.changed = False
+
+    def load() -> 'SpriteHashes':
+        data = File.readJson(SpriteHashes.filename, {})
+        return SpriteHashes(data.get("sprites", {}))
+
+    def save(self) -> None:
+        if not self.changed: return
+        File.writeJson(SpriteHashes.filename, { "sprites": self.sprites })
+        self.changed = False
+
+    # Hashing
+
+    def exactHash(image: Image.Image) -> str:
+        digest = hashlib.sha1(f"{image.width}x{image.height}".encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def perceptualHash(image: Image.Image) -> int:
+        """One bit per pair of horizontal neighbors in a shrunk grayscale copy, set where the left one is brighter."""
+        size = SpriteHashes.hashSize
+        background = Image.new('RGBA', image.size, (128, 128, 128, 255))
+        gray = Image.alpha_composite(background, image).convert('L')
+        pixels = list(gray.resize((size + 1, size), Image.BILINEAR).getdata())
+        ret = 0
+        for y in range(size):
+            for x in range(size):
+                i = y*(size + 1) + x
+                ret = (ret << 1) | (pixels[i] > pixels[i + 1])
+        return ret
+
+    def hashFile(filename: str) -> dict:
+        """A cache entry for one png. Runs in the worker processes."""
+        stat = os.stat(filename)
+        with Image.open(filename) as image:
+            cropped = Graphics.crop(image)
+        return {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "exact": SpriteHashes.exactHash(cropped) if cropped is not None else None,
+            "perceptual": SpriteHashes.perceptualHash(cropped) if cropped is not None else None,
+        }
+
+    def update(self, filenames: list[str], workers: int=None) -> None:
+        """Hashes the given pngs that changed since they were cached, and forgets every other one."""
+        stale = []
+        for filename in filenames:
+            stat = os.stat(filename)
+            entry = self.sprites.get(filename)
+            if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                stale.append(filename)
+        if len(stale) != 0:
+            entries = Batch.run(SpriteHashes.hashFile, stale, workers=workers, label="Hashed")
+            self.sprites.update(zip(stale, entries))
+            self.changed = True
+
+        kept = set(filenames)
+        gone = [ filename for filename in self.sprites if filename not in kept ]
+        for filename in gone:
+            del self.sprites[filename]
+            self.changed = True
+
+    # Finding duplicates
+
+    def getFilesByExactHash(self) -> dict[str, list[str]]:
+        ret = {}
+        for filename in sorted(self.sprites):
+            exact = self.sprites[filename]["exact"]
+            if exact is None: continue
+            ret.setdefault(exact, []).append(filename)
+        return ret
+
+    def getIdentical(self) -> list[list[str]]:
+        """Groups of sprites with exactly the same cropped pixels."""
+        return [
+            filenames for filenames in self.getFilesByExactHash().values()
+            if len(filenames) > 1
+        ]
+
+    def getSimilar(self, radius: int) -> list[list[str]]:
+        """
+        Groups of sprites that aren't all identical, but whose perceptual hashes chain
+        together within radius bits of each other. Sprites with the same perceptual
+        hash are only indexed once.
+        """
+        filesByExactHash = self.getFilesByExactHash()
+        exactsByPerceptual = {}
+        for exact, filenames in filesByExactHash.items():
+            perceptual = self.sprites[filenames[0]]["perceptual"]
+            exactsByPerceptual.setdefault(perceptual, []).append(exact)
+        keys = list(exactsByPerceptual)
+
+        # union-find over the distinct perceptual hashes
+        parents = list(range(len(keys)))
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+        for i, j in HashIndex.getPairs(keys, radius):
+            parents[find(i)] = find(j)
+
+        groups = {}
+        for i in range(len(keys)):
+            groups.setdefault(find(i), []).extend(exactsByPerceptual[keys[i]])
+        return [
+            sorted([ filename for exact in exacts for filename in filesByExactHash[exact] ])
+            for exacts in groups.values()
+            if len(exacts) > 1
+        ]
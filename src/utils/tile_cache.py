@@ -0,0 +1,104 @@
+import hashlib
+import os
+from typing import Callable
+import zlib
+
+from PIL import Image
+
+from utils.write_behind import WriteBehind
+
+
+class TileCache:
+    """
+    An on-disk cache of rendered tiles, one file per tile under cache/tiles, named by a
+    hash of the sprite's path and mtime and whatever else the tile depends on (its size,
+    its caption). A sprite that changed gets new names, so tiles are never stale, and
+    the ones it had just stop being used. Tiles are stored as their raw pixels behind a
+    "mode width height" line, compressed with zlib, which is quicker to read than a png
+    and compresses without holding the GIL.
+
+    Reading a tile touches its mtime, and once the tiles take more than maxBytes the
+    least recently used ones are deleted, down to evictTo of that. Tiles are written
+    on WriteBehind's thread, so a miss costs no more than rendering without the cache.
+    """
+    directory = "cache/tiles"
+    # bump when tiles are rendered differently, so the old ones aren't used
+    version = 2
+    maxBytes = 256 * 1024 * 1024
+    evictTo = 0.8
+
+    # bytes of tiles on disk, counted on the first write
+    size: int = None
+
+    def getFilename(filename: str, details: str) -> str:
+        """Where the tile of filename with details is kept, or None if filename doesn't exist."""
+        try:
+            mtime = os.stat(filename).st_mtime_ns
+        except OSError:
+            return None
+        key = f"{TileCache.version}\0{filename}\0{mtime}\0{details}"
+        return f"{TileCache.directory}/{hashlib.sha1(key.encode()).hexdigest()}.tile"
+
+    def read(tileFilename: str):
+        pending = WriteBehind.getPending(tileFilename)
+        if pending is not None: return pending.copy()
+        try:
+            with open(tileFilename, 'rb') as file:
+                mode, width, height = file.readline().decode().split()
+                pixels = zlib.decompress(file.read())
+            os.utime(tileFilename)
+        except (OSError, ValueError, zlib.error):
+            return None
+        return Image.frombytes(mode, (int(width), int(height)), pixels)
+
+    def write(tileFilename: str, image) -> None:
+        """Writes a tile atomically, then evicts if the cache got too big. Runs on WriteBehind's thread."""
+        os.makedirs(TileCache.directory, exist_ok=True)
+        temporary = f"{tileFilename}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as file:
+            file.write(f"{image.mode} {image.width} {image.height}\n".encode())
+            file.write(zlib.compress(image.tobytes(), 1))
+        os.replace(temporary, tileFilename)
+        if TileCache.size is None:
+            TileCache.size = TileCache.getSize()
+        else:
+            TileCache.size += os.path.getsize(tileFilename)
+        if TileCache.size > TileCache.maxBytes:
+            TileCache.evict()
+
+    def getEntries() -> list[os.DirEntry]:
+        try:
+            with os.scandir(TileCache.directory) as entries:
+                # not the temporary files of writes underway
+                return [ entry for entry in entries if entry.name.endswith(".tile") ]
+        except OSError:
+            return []
+
+    def getSize() -> int:
+        return sum(entry.stat().st_size for entry in TileCache.getEntries())
+
+    def evict() -> None:
+        """Deletes the least recently used tiles until they take at most evictTo of maxBytes."""
+        entries = sorted(TileCache.getEntries(), key=lambda entry: entry.stat().st_mtime_ns)
+        size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if size <= TileCache.maxBytes * TileCache.evictTo: break
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            size -= entry.stat().st_size
+        TileCache.size = size
+
+    def get(filename: str, details: str, render: Callable[[], Image.Image]):
+        """
+        Returns the cached tile of filename with details, or renders and caches it.
+        The tile must not be modified.
+        """
+        tileFilename = TileCache.getFilename(filename, details)
+        if tileFilename is None: return render()
+        image = TileCache.read(tileFilename)
+        if image is not None: return image
+        image = render()
+        WriteBehind.save(tileFilename, image, TileCache.write)
+        return image
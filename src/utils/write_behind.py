@@ -0,0 +1,97 @@
+import atexit
+import threading
+import time
+from typing import Any, Callable
+
+from utils.program import Program
+
+
+class WriteBehind:
+    """
+    Writes files on a background thread, so saving doesn't wait on the disk.
+
+    Saves to a file that come in before the thread gets to it are coalesced into one
+    write of the newest contents, each with the write function it was saved with (which
+    should write atomically, like File.writeTextAtomic), and whatever is still waiting
+    gets written when the program exits.
+    """
+    # how long the thread waits for more saves before writing
+    delay = 0.2
+
+    # filename -> (newest contents not yet picked up by the thread, write function)
+    pending: dict[str, tuple[Any, Callable]] = {}
+    # filename -> (contents, write function) being written right now
+    writing: dict[str, tuple[Any, Callable]] = {}
+    condition = threading.Condition()
+    thread: threading.Thread = None
+
+    def save(filename: str, contents, write: Callable[[str, Any], None]) -> None:
+        """Has write(filename, contents) called on the thread soon, unless newer contents are saved first."""
+        with WriteBehind.condition:
+            WriteBehind.pending[filename] = (contents, write)
+            if WriteBehind.thread is None:
+                WriteBehind.thread = threading.Thread(
+                    target=WriteBehind.run,
+                    name="WriteBehind",
+                    daemon=True,
+                )
+                WriteBehind.thread.start()
+                atexit.register(WriteBehind.flush)
+            WriteBehind.condition.notify_all()
+
+    def getPending(filename: str):
+        """The contents saved for filename that may not be on disk yet, or None."""
+        with WriteBehind.condition:
+            saved = WriteBehind.pending.get(filename, WriteBehind.writing.get(filename))
+            return saved[0] if saved is not None else None
+
+    def write(filename: str, saved: tuple[Any, Callable]) -> None:
+        """Writes a file that was taken, then marks it done even if writing failed."""
+        contents, write = saved
+        try:
+            write(filename, contents)
+        except Exception as e:
+            Program.printError(f"Couldn't save {filename}: {e}")
+        finally:
+            WriteBehind.done(filename)
+
+    def take() -> tuple[str, tuple[Any, Callable]] | None:
+        """
+        Moves a pending file that isn't already being written to writing, or returns
+        None if there isn't one. Call with the condition held.
+        """
+        for filename in WriteBehind.pending:
+            if filename in WriteBehind.writing: continue
+            saved = WriteBehind.pending.pop(filename)
+            WriteBehind.writing[filename] = saved
+            return filename, saved
+        return None
+
+    def done(filename: str) -> None:
+        with WriteBehind.condition:
+            del WriteBehind.writing[filename]
+            WriteBehind.condition.notify_all()
+
+    def run() -> None:
+        while True:
+            with WriteBehind.condition:
+                while len(WriteBehind.pending) == 0:
+                    WriteBehind.condition.wait()
+            # give quick successive saves a moment to pile up, then write all of them
+            time.sleep(WriteBehind.delay)
+            while True:
+                with WriteBehind.condition:
+                    taken = WriteBehind.take()
+                if taken is None: break
+                WriteBehind.write(*taken)
+
+    def flush() -> None:
+        """Writes everything pending from the calling thread, and waits for any write already underway."""
+        while True:
+            with WriteBehind.condition:
+                if len(WriteBehind.pending) == 0 and len(WriteBehind.writing) == 0: return
+                taken = WriteBehind.take()
+                if taken is None:
+                    WriteBehind.condition.wait()
+                    continue
+            WriteBehind.write(*taken)
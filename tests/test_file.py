@@ -0,0 +1,67 @@
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from PIL import Image
+
+from utils.exporter import Exporter
+from utils.file import File
+
+
+class DeletedDirectoryTest(unittest.TestCase):
+    """Writing into a remembered directory that something else deleted since."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.exported = f"{self.root}/exported"
+        File.createdDirectories = set()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        File.createdDirectories = set()
+
+    def test_saveImage(self):
+        image = Image.new("RGBA", (2, 2), (255, 0, 0, 255))
+        File.saveImage(f"{self.exported}/sprites/0.png", image)
+        shutil.rmtree(self.exported)
+        File.saveImage(f"{self.exported}/sprites/1.png", image)
+        self.assertTrue(File.exists(f"{self.exported}/sprites/1.png"))
+        # the parent was forgotten too, so writing next to it works without a retry
+        File.saveImage(f"{self.exported}/2.png", image)
+        self.assertTrue(File.exists(f"{self.exported}/2.png"))
+
+    def test_writeText(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            File.writeText(f"{self.exported}/data/a.json", "{}")
+            shutil.rmtree(self.exported)
+            File.writeText(f"{self.exported}/data/b.json", "{}")
+        self.assertEqual(File.readText(f"{self.exported}/data/b.json", None), "{}")
+
+    def test_writeTextAtomic(self):
+        File.writeTextAtomic(f"{self.exported}/a.json", "{}")
+        shutil.rmtree(self.exported)
+        File.writeTextAtomic(f"{self.exported}/b.json", "[]")
+        self.assertEqual(File.readText(f"{self.exported}/b.json", None), "[]")
+
+    def test_exporterCopyFile(self):
+        source = f"{self.root}/source.png"
+        Image.new("RGBA", (2, 2)).save(source)
+        Exporter.incremental(self.exported).copyFile(source, "sprites/0.png")
+        shutil.rmtree(self.exported)
+        Exporter.incremental(self.exported).copyFile(source, "sprites/0.png")
+        self.assertTrue(File.exists(f"{self.exported}/sprites/0.png"))
+
+    def test_missingSource(self):
+        File.createDirectory(self.exported)
+        with self.assertRaises(FileNotFoundError):
+            Exporter.incremental(self.exported).copyFile(f"{self.root}/missing.png", "0.png")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from PIL import Image
+
+from utils.box import Box
+from utils.file import File
+from utils.sheet import Sheet
+
+
+class FinalizeTest(unittest.TestCase):
+    """Sheet.finalize on a 48x16 sheet of three 16x16 sprites, marked done in the unpacker."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.root = tempfile.mkdtemp()
+        os.chdir(self.root)
+        File.createdDirectories = set()
+        self.source = "raw_content/T/sheet.png"
+        self.saveSource([True, True, True])
+        self.sheet = Sheet(self.source, { i: Box(16*i, 0, 16, 16) for i in range(3) })
+        self.progressFilename = self.sheet.getProgressFilename()
+        File.writeTextAtomic(self.progressFilename, json.dumps(self.sheet.getProgressData(done=True)))
+        self.sheet.saveFinalImages(verbose=False)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.root, ignore_errors=True)
+        File.createdDirectories = set()
+
+    def saveSource(self, filled):
+        image = Image.new("RGBA", (48, 16))
+        for i, isFilled in enumerate(filled):
+            if isFilled: image.paste((255, 0, 0, 255), (16*i + 4, 4, 16*i + 12, 12))
+        File.saveImage(self.source, image)
+
+    def ageSprites(self):
+        """Makes the sprites older than the source and progress.json, as mtimes may not tick between writes."""
+        for filename in File.getOutputFiles(self.source):
+            mtime = os.path.getmtime(filename) - 10
+            os.utime(filename, (mtime, mtime))
+
+    def writeProgress(self, data):
+        File.writeTextAtomic(self.progressFilename, json.dumps(data))
+        self.ageSprites()
+
+    def test_upToDate(self):
+        self.assertEqual(Sheet.finalize(self.progressFilename), "up to date")
+
+    def test_deletedByHand(self):
+        os.remove(self.sheet.getSubpath(1))
+        File.recordDeletedSprite(self.sheet.getSubpath(1))
+        self.ageSprites()
+        self.assertEqual(Sheet.finalize(self.progressFilename), "finalized")
+        self.assertFalse(File.exists(self.sheet.getSubpath(1)))
+        self.assertTrue(File.exists(self.sheet.getSubpath(0)))
+
+    def test_allDeletedByHand(self):
+        for index in self.sheet.boxes:
+            os.remove(self.sheet.getSubpath(index))
+            File.recordDeletedSprite(self.sheet.getSubpath(index))
+        self.assertEqual(Sheet.finalize(self.progressFilename, force=True), "finalized")
+        self.assertEqual(File.getOutputFiles(self.source), [])
+
+    def test_boxAddedAfterFinalizing(self):
+        data = File.readJson(self.progressFilename)
+        data["boxes"].append(Box(0, 0, 32, 16).toData(3))
+        self.writeProgress(data)
+        self.assertEqual(Sheet.finalize(self.progressFilename), "finalized")
+        self.assertTrue(File.exists(Sheet.fromData(data).getSubpath(3)))
+
+    def test_boxNowEmpty(self):
+        self.saveSource([True, False, True])
+        self.ageSprites()
+        self.assertEqual(Sheet.finalize(self.progressFilename), "finalized")
+        self.assertFalse(File.exists(self.sheet.getSubpath(1)))
+        self.assertEqual(Sheet.finalize(self.progressFilename), "up to date")
+
+    def test_notDone(self):
+        self.writeProgress(self.sheet.getProgressData())
+        self.assertEqual(Sheet.finalize(self.progressFilename), "not done")
+
+    def test_savedBeforeDoneWasRecorded(self):
+        os.remove(self.sheet.getSubpath(2))
+        self.writeProgress(self.sheet.toData())
+        self.assertEqual(Sheet.finalize(self.progressFilename), "finalized")
+        self.assertFalse(File.exists(self.sheet.getSubpath(2)))
+        data = File.readJson(self.progressFilename)
+        self.assertEqual((data["done"], data["deleted"]), (True, [2]))
+
+
+if __name__ == "__main__":
+    unittest.main()